@@ -0,0 +1,72 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db, get_async_read_db
+from . import schemas
+from .routers import (
+    PRODUCTS_MAX_PAGE_SIZE,
+    current_user_id,
+    _list_products,
+    _cart_add,
+    _get_cart,
+    _create_order,
+)
+
+
+# Async versions of the hot endpoints, mounted in place of the sync ones when
+# ASYNC_DB is on. Database I/O goes through the async driver, so a slow query
+# no longer ties up a threadpool worker; the endpoint logic itself is the
+# shared sync implementation, run on the connection via AsyncSession.run_sync.
+router = APIRouter()
+
+
+@router.get("/products", response_model=list[schemas.ProduitWithDetails])
+async def list_products(
+    request: Request,
+    response: Response,
+    after: str | None = None,
+    limit: int | None = Query(None, ge=1, le=PRODUCTS_MAX_PAGE_SIZE),
+    q: str | None = None,
+    id_categorie: int | None = None,
+    id_marque: int | None = None,
+    min_prix: float | None = Query(None, ge=0),
+    max_prix: float | None = Query(None, ge=0),
+    since: datetime | None = None,
+    sort: str = "id",
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    def run(session):
+        result = _list_products(
+            session, request, response, after, limit, q, id_categorie, id_marque, min_prix, max_prix, since, sort
+        )
+        if isinstance(result, Response):
+            return result
+        # Serialize while the session can still load attributes
+        return [schemas.ProduitWithDetails.model_validate(p) for p in result]
+
+    return await db.run_sync(run)
+
+
+@router.post("/cart/add")
+async def cart_add(
+    item: schemas.CartAddItem,
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_cart_add, user_id, item)
+
+
+@router.get("/cart", response_model=schemas.CartOut)
+async def get_cart(
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_get_cart, user_id)
+
+
+@router.post("/orders", response_model=schemas.OrderOut)
+async def create_order(
+    user_id: int = Depends(current_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_create_order, user_id)
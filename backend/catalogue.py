@@ -0,0 +1,427 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from functools import cached_property
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+from .database import SessionLocal, engine
+from . import models, schemas
+
+
+# Optional in-process read model of the catalogue.
+# When enabled, product/category/brand listings are served from an immutable
+# snapshot of pre-serialized JSON rows instead of the database. Admin writes
+# replace the snapshot (copy-on-write) right after they commit. The snapshot
+# is per process: with several workers, writes only refresh the worker that
+# handled them, so enable it for single-worker deployments.
+CATALOGUE_CACHE = os.getenv("CATALOGUE_CACHE", "0").lower() in ("1", "true", "yes")
+
+# Conditional GET support. The catalogue version lives in the database so all
+# workers agree on it; each worker re-reads it at most every
+# CATALOGUE_VERSION_TTL seconds, so revalidations (304s) normally skip the DB.
+CATALOGUE_VERSION_TTL = float(os.getenv("CATALOGUE_VERSION_TTL", "1.0"))
+CATALOGUE_MAX_AGE = int(os.getenv("CATALOGUE_MAX_AGE", "0"))
+CATALOGUE_STALE_WHILE_REVALIDATE = int(os.getenv("CATALOGUE_STALE_WHILE_REVALIDATE", "60"))
+
+# Stock-only changes (cart holds and releases, checkouts, expired holds) are
+# too frequent to bump the version one by one: that would serialize all cart
+# traffic on the version row and defeat the ETags. commit_stock() queues the
+# products instead, and a background flush bumps the version once per
+# CATALOGUE_STOCK_FLUSH_INTERVAL seconds for all of them, so listings show
+# stock up to that late. 0 bumps at every commit.
+CATALOGUE_STOCK_FLUSH_INTERVAL = float(os.getenv("CATALOGUE_STOCK_FLUSH_INTERVAL", "5"))
+
+
+class CatalogueSnapshot:
+    """Immutable catalogue view: JSON rows ordered by primary key."""
+
+    def __init__(self, product_ids: tuple, product_rows: tuple, product_facets: tuple, facet_counts: dict, categories: tuple, brands: tuple):
+        self.product_ids = product_ids          # sorted id_produit values
+        self.product_rows = product_rows        # ProduitWithDetails JSON, same order
+        self.product_facets = product_facets    # (id_categorie, id_marque, prix), same order
+        self.facet_counts = facet_counts        # (id_categorie, id_marque, prix) -> products; never mutated
+        self.categories = categories            # CategorieOut JSON rows
+        self.brands = brands                    # MarqueOut JSON rows
+
+    @cached_property
+    def products_json(self) -> bytes:
+        return _json_array(self.product_rows)
+
+    @cached_property
+    def category_names(self) -> dict[int, str]:
+        return {c["id_categorie"]: c["nom"] for c in json.loads(self.categories_json)}
+
+    @cached_property
+    def brand_names(self) -> dict[int, str]:
+        return {b["id_marque"]: b["nom"] for b in json.loads(self.brands_json)}
+
+    @cached_property
+    def categories_json(self) -> bytes:
+        return _json_array(self.categories)
+
+    @cached_property
+    def brands_json(self) -> bytes:
+        return _json_array(self.brands)
+
+    def page(self, after: int | None, limit: int) -> tuple[bytes, int | None]:
+        """Keyset page of products with id_produit > after; returns (body, next cursor)."""
+        start = 0 if after is None else bisect_right(self.product_ids, after)
+        end = start + limit
+        body = _json_array(self.product_rows[start:end])
+        next_cursor = self.product_ids[end - 1] if end < len(self.product_ids) else None
+        return body, next_cursor
+
+
+_snapshot: CatalogueSnapshot | None = None
+# Serializes copy-on-write updates; readers never take it
+_write_lock = threading.Lock()
+
+
+def _json_array(rows) -> bytes:
+    return b"[" + b",".join(rows) + b"]"
+
+
+def _product_row(product: models.Produit) -> bytes:
+    return schemas.ProduitWithDetails.model_validate(product).model_dump_json().encode()
+
+
+def _product_facet(product: models.Produit) -> tuple:
+    return product.id_categorie, product.id_marque, None if product.prix is None else float(product.prix)
+
+
+def _count_facets(facets) -> dict[tuple, int]:
+    counts: dict[tuple, int] = {}
+    for facet in facets:
+        counts[facet] = counts.get(facet, 0) + 1
+    return counts
+
+
+def _move_facet(counts: dict[tuple, int], old: tuple | None, new: tuple | None) -> None:
+    """Move one product between facet counts (None: absent from the catalogue)."""
+    if old is not None:
+        counts[old] -= 1
+        if not counts[old]:
+            del counts[old]
+    if new is not None:
+        counts[new] = counts.get(new, 0) + 1
+
+
+def _taxonomy(db: Session) -> tuple[tuple, tuple]:
+    categories = tuple(
+        schemas.CategorieOut.model_validate(c).model_dump_json().encode()
+        for c in db.query(models.Categorie).order_by(models.Categorie.id_categorie)
+    )
+    brands = tuple(
+        schemas.MarqueOut.model_validate(b).model_dump_json().encode()
+        for b in db.query(models.Marque).order_by(models.Marque.id_marque)
+    )
+    return categories, brands
+
+
+# Database URL -> (committed version, when it was read)
+_versions: dict[str, tuple[int, float]] = {}
+
+
+def ensure_version(db: Session) -> None:
+    """Create the version row if this database doesn't have one yet."""
+    if db.query(models.CatalogueVersion).get(1) is None:
+        db.add(models.CatalogueVersion(id=1, version=0))
+        db.commit()
+
+
+def bump_version(db: Session, product_ids=(), deleted: bool = False) -> int:
+    """Increment the catalogue version inside the caller's transaction.
+
+    `product_ids` are logged to ProduitChange under the new version (as
+    tombstones when `deleted`) for delta sync. Call before commit; pass the
+    result to set_version() once committed.
+    """
+    updated = (
+        db.query(models.CatalogueVersion)
+        .filter(models.CatalogueVersion.id == 1)
+        .update({models.CatalogueVersion.version: models.CatalogueVersion.version + 1})
+    )
+    if updated:
+        version = db.query(models.CatalogueVersion.version).filter(models.CatalogueVersion.id == 1).scalar()
+    else:
+        db.add(models.CatalogueVersion(id=1, version=1))
+        version = 1
+    now = datetime.utcnow()
+    changes = [
+        dict(id_produit=pid, version=version, deleted=deleted, date_changement=now)
+        for pid in set(product_ids)
+    ]
+    if changes:
+        db.execute(insert(models.ProduitChange), changes)
+    return version
+
+
+def commit_products(db: Session, product_ids) -> None:
+    """Commit a transaction that changed the given products (e.g. their stock).
+
+    Bumps the version and logs the change, commits, then refreshes the
+    read model.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        db.commit()
+        return
+    version = bump_version(db, product_ids)
+    db.commit()
+    set_version(version)
+    products_saved(db, product_ids)
+
+
+_stock_pending: set[int] = set()
+_stock_lock = threading.Lock()
+
+
+def commit_stock(db: Session, product_ids) -> None:
+    """Commit a transaction that only moved the given products' stock.
+
+    The version bump is left to flush_stock().
+    """
+    if CATALOGUE_STOCK_FLUSH_INTERVAL <= 0:
+        commit_products(db, product_ids)
+        return
+    db.commit()
+    with _stock_lock:
+        _stock_pending.update(product_ids)
+
+
+def flush_stock(db: Session) -> int:
+    """Bump the version once for all products queued by commit_stock()."""
+    with _stock_lock:
+        product_ids = sorted(_stock_pending)
+        _stock_pending.clear()
+    if not product_ids:
+        return 0
+    try:
+        commit_products(db, product_ids)
+    except Exception:
+        db.rollback()
+        with _stock_lock:
+            _stock_pending.update(product_ids)
+        raise
+    return len(product_ids)
+
+
+_stop = threading.Event()
+_worker: threading.Thread | None = None
+
+
+def _flush_loop():
+    while not _stop.wait(CATALOGUE_STOCK_FLUSH_INTERVAL):
+        db = SessionLocal()
+        try:
+            flush_stock(db)
+        except Exception:
+            # Still queued; try again next interval
+            pass
+        finally:
+            db.close()
+
+
+def start_maintenance() -> None:
+    """Start the thread that flushes queued stock changes."""
+    global _worker
+    if CATALOGUE_STOCK_FLUSH_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_flush_loop, name="catalogue-stock-flush", daemon=True)
+    _worker.start()
+
+
+def stop_maintenance() -> None:
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+    db = SessionLocal()
+    try:
+        flush_stock(db)
+    except Exception:
+        pass
+    finally:
+        db.close()
+
+
+def read_version(db: Session) -> int:
+    """Committed catalogue version, read from the database (no caching)."""
+    return db.query(models.CatalogueVersion.version).filter(models.CatalogueVersion.id == 1).scalar() or 0
+
+
+def changes_since(db: Session, since: int, until: int) -> tuple[list[int], list[int]]:
+    """Product ids upserted and deleted in versions (since, until].
+
+    Only the latest log entry per product counts, so a product created and
+    then deleted within the window is reported as deleted.
+    """
+    log = models.ProduitChange
+    rows = (
+        db.query(log.id_produit, log.deleted)
+        .filter(log.version > since, log.version <= until)
+        .order_by(log.version, log.id_change)
+    )
+    latest: dict[int, bool] = {}
+    for id_produit, was_deleted in rows:
+        latest[id_produit] = was_deleted
+    upserted = sorted(pid for pid, gone in latest.items() if not gone)
+    removed = sorted(pid for pid, gone in latest.items() if gone)
+    return upserted, removed
+
+
+def _database_key(bind) -> str:
+    return str(bind.url)
+
+
+def set_version(version: int) -> None:
+    """Record a version committed on the primary so this worker's ETags change at once."""
+    key = _database_key(engine)
+    known = _versions.get(key)
+    if known is None or version > known[0]:
+        _versions[key] = (version, time.monotonic())
+
+
+def current_version(db: Session | None = None) -> int:
+    """Catalogue version as seen by the database behind `db` (the primary by default).
+
+    Pass the session that reads the response body: read from a lagging
+    replica, the body must not carry the primary's newer version. Cached
+    per database for CATALOGUE_VERSION_TTL seconds.
+    """
+    key = _database_key(db.get_bind() if db is not None else engine)
+    now = time.monotonic()
+    known = _versions.get(key)
+    if known is None or now - known[1] >= CATALOGUE_VERSION_TTL:
+        if db is not None:
+            version = read_version(db)
+        else:
+            session = SessionLocal()
+            try:
+                version = read_version(session)
+            finally:
+                session.close()
+        known = (version, now)
+        _versions[key] = known
+    return known[0]
+
+
+def cache_headers(db: Session | None = None) -> dict[str, str]:
+    """ETag and Cache-Control headers for catalogue listings read through `db`."""
+    cache_control = f"public, max-age={CATALOGUE_MAX_AGE}"
+    if CATALOGUE_STALE_WHILE_REVALIDATE:
+        cache_control += f", stale-while-revalidate={CATALOGUE_STALE_WHILE_REVALIDATE}"
+    return {"ETag": f'"catalogue-{current_version(db)}"', "Cache-Control": cache_control}
+
+
+def not_modified(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def current() -> CatalogueSnapshot | None:
+    """The live snapshot, or None when the read model is disabled or not loaded."""
+    return _snapshot
+
+
+def load(db: Session) -> CatalogueSnapshot:
+    """Build a full snapshot from the database and swap it in."""
+    global _snapshot
+    products = (
+        db.query(models.Produit)
+        .options(joinedload(models.Produit.categorie), joinedload(models.Produit.marque))
+        .order_by(models.Produit.id_produit)
+        .all()
+    )
+    categories, brands = _taxonomy(db)
+    facets = tuple(_product_facet(p) for p in products)
+    snapshot = CatalogueSnapshot(
+        tuple(p.id_produit for p in products),
+        tuple(_product_row(p) for p in products),
+        facets,
+        _count_facets(facets),
+        categories,
+        brands,
+    )
+    with _write_lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def products_saved(db: Session, product_ids) -> None:
+    """Refresh product rows after a committed create/update (one query)."""
+    global _snapshot
+    if _snapshot is None:
+        return
+    wanted = sorted(set(product_ids))
+    if not wanted:
+        return
+    # Read under the lock so concurrent writes to one product apply in order
+    with _write_lock:
+        products = {
+            p.id_produit: p
+            for p in db.query(models.Produit)
+            .options(joinedload(models.Produit.categorie), joinedload(models.Produit.marque))
+            .filter(models.Produit.id_produit.in_(wanted))
+            .populate_existing()
+        }
+        snap = _snapshot
+        ids, rows, facets = list(snap.product_ids), list(snap.product_rows), list(snap.product_facets)
+        counts = dict(snap.facet_counts)
+        for id_produit in wanted:
+            product = products.get(id_produit)
+            pos = bisect_right(ids, id_produit)
+            found = bool(pos) and ids[pos - 1] == id_produit
+            if product is None:
+                if found:
+                    _move_facet(counts, facets[pos - 1], None)
+                    del ids[pos - 1], rows[pos - 1], facets[pos - 1]
+            elif found:
+                rows[pos - 1] = _product_row(product)
+                _move_facet(counts, facets[pos - 1], _product_facet(product))
+                facets[pos - 1] = _product_facet(product)
+            else:
+                ids.insert(pos, id_produit)
+                rows.insert(pos, _product_row(product))
+                facets.insert(pos, _product_facet(product))
+                _move_facet(counts, None, facets[pos])
+        _snapshot = CatalogueSnapshot(tuple(ids), tuple(rows), tuple(facets), counts, snap.categories, snap.brands)
+
+
+def product_deleted(id_produit: int) -> None:
+    """Drop one product row after a committed delete."""
+    global _snapshot
+    if _snapshot is None:
+        return
+    with _write_lock:
+        snap = _snapshot
+        pos = bisect_right(snap.product_ids, id_produit)
+        if not pos or snap.product_ids[pos - 1] != id_produit:
+            return
+        counts = dict(snap.facet_counts)
+        _move_facet(counts, snap.product_facets[pos - 1], None)
+        _snapshot = CatalogueSnapshot(
+            snap.product_ids[:pos - 1] + snap.product_ids[pos:],
+            snap.product_rows[:pos - 1] + snap.product_rows[pos:],
+            snap.product_facets[:pos - 1] + snap.product_facets[pos:],
+            counts,
+            snap.categories,
+            snap.brands,
+        )
+
+
+def taxonomy_changed(db: Session) -> None:
+    """Reload categories and brands after a committed create."""
+    global _snapshot
+    if _snapshot is None:
+        return
+    with _write_lock:
+        categories, brands = _taxonomy(db)
+        snap = _snapshot
+        _snapshot = CatalogueSnapshot(snap.product_ids, snap.product_rows, snap.product_facets, snap.facet_counts, categories, brands)
@@ -1,6 +1,9 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from dotenv import load_dotenv
 
 
@@ -22,14 +25,190 @@ def _build_db_url() -> str:
 
 
 DATABASE_URL = _build_db_url()
+# Optional read replica for read-only endpoints (see get_read_db)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+# Connection pool. Instead of pinging on every checkout, connections are
+# recycled before server-side idle timeouts (MySQL wait_timeout defaults to
+# 8 hours) and pinged only when they sat idle longer than DB_PING_AFTER_IDLE.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_PING_AFTER_IDLE = float(os.getenv("DB_PING_AFTER_IDLE", "60"))
+
+# Opt-in SQLite performance profile (SQLITE_TUNING=1), applied to every new
+# pooled connection. WAL lets readers proceed while a checkout is writing;
+# synchronous=NORMAL is durable against crashes of the app but may lose the
+# last transactions on power loss.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "0").lower() in ("1", "true", "yes")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Seconds between PRAGMA optimize + WAL checkpoint runs; 0 disables them
+SQLITE_MAINTENANCE_INTERVAL = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL", "600"))
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    ):
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _mark_checkin(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.monotonic()
+
+
+def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+    checked_in_at = connection_record.info.get("checked_in_at")
+    if checked_in_at is None or time.monotonic() - checked_in_at < DB_PING_AFTER_IDLE:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    except Exception:
+        # The pool discards this connection and checks out a fresh one
+        raise DisconnectionError()
+    finally:
+        cursor.close()
+
+
+def _make_engine(url: str):
+    is_sqlite = url.startswith("sqlite")
+    kwargs = {"connect_args": {"check_same_thread": False} if is_sqlite else {}}
+    # In-memory SQLite uses a per-thread singleton pool that takes no sizing
+    if not (is_sqlite and (":memory:" in url or url.rstrip("/") == "sqlite:")):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    new_engine = create_engine(url, **kwargs)
+    event.listen(new_engine, "checkin", _mark_checkin)
+    event.listen(new_engine, "checkout", _ping_if_idle)
+    if is_sqlite and SQLITE_TUNING:
+        event.listen(new_engine, "connect", _tune_sqlite)
+    return new_engine
+
+
+engine = _make_engine(DATABASE_URL)
+read_engine = _make_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+
+sqlite_tuned = SQLITE_TUNING and engine.dialect.name == "sqlite"
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("Write attempted on a read-only session")
+
 
 Base = declarative_base()
 
+# Optional async path (ASYNC_DB=1): the hot endpoints are served by async
+# handlers on an async driver (aiosqlite for SQLite, asyncmy for MySQL; both
+# also need greenlet). ASYNC_DATABASE_URL / ASYNC_DATABASE_READ_URL override
+# the URLs derived from DATABASE_URL / DATABASE_READ_URL.
+ASYNC_DB = os.getenv("ASYNC_DB", "0").lower() in ("1", "true", "yes")
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+asyncmy"}
+
+
+def _async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for {backend}; set ASYNC_DATABASE_URL")
+    return f"{_ASYNC_DRIVERS[backend]}://{rest}"
+
+
+def _make_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    kwargs = {}
+    if not url.startswith("sqlite"):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    new_engine = create_async_engine(url, **kwargs)
+    event.listen(new_engine.sync_engine, "checkin", _mark_checkin)
+    event.listen(new_engine.sync_engine, "checkout", _ping_if_idle)
+    if url.startswith("sqlite") and SQLITE_TUNING:
+        event.listen(new_engine.sync_engine, "connect", _tune_sqlite)
+    return new_engine
+
+
+async_engine = async_read_engine = None
+AsyncSessionLocal = AsyncReadSessionLocal = None
+
+if ASYNC_DB:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = _make_async_engine(os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL))
+    if DATABASE_READ_URL or os.getenv("ASYNC_DATABASE_READ_URL"):
+        async_read_engine = _make_async_engine(os.getenv("ASYNC_DATABASE_READ_URL") or _async_url(DATABASE_READ_URL))
+    else:
+        async_read_engine = async_engine
+
+    class _ReadOnlySession(Session):
+        pass
+
+    event.listen(_ReadOnlySession, "before_flush", _reject_writes)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, sync_session_class=_ReadOnlySession)
+
+
+def sqlite_maintenance() -> None:
+    """Refresh query planner statistics and fold the WAL back into the database."""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        # PASSIVE never waits on readers or writers; busy pages are left for next time
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+
+
+_stop = threading.Event()
+_maintenance: threading.Thread | None = None
+
+
+def _maintenance_loop():
+    while not _stop.wait(SQLITE_MAINTENANCE_INTERVAL):
+        try:
+            sqlite_maintenance()
+        except Exception:
+            # Database busy; try again next interval
+            pass
+
+
+def start_maintenance() -> None:
+    """Start periodic SQLite maintenance when the tuning profile is on."""
+    global _maintenance
+    if not sqlite_tuned or SQLITE_MAINTENANCE_INTERVAL <= 0:
+        return
+    if _maintenance is not None and _maintenance.is_alive():
+        return
+    _stop.clear()
+    _maintenance = threading.Thread(target=_maintenance_loop, name="sqlite-maintenance", daemon=True)
+    _maintenance.start()
+
+
+def stop_maintenance() -> None:
+    _stop.set()
+    if _maintenance is not None:
+        _maintenance.join(timeout=5)
+
 
 def get_db():
     db = SessionLocal()
@@ -39,3 +218,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_read_db():
+    """Session for read-only endpoints: the replica when DATABASE_READ_URL is set.
+
+    Replicas may lag the primary slightly; don't use this where a request
+    must see its own writes.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
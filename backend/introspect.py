@@ -0,0 +1,75 @@
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+
+# Schema capabilities of the live database, detected once at startup.
+# Deployments differ in table casing (Commande/commande) and in which order
+# columns exist (legacy tables have prix/date_creation and no id_commande or
+# statut). Order and user endpoints pick their query from these flags
+# instead of trying alternatives at request time.
+
+# Columns of the canonical Commande table (models.Commande)
+_CANONICAL_ORDER_COLUMNS = {
+    "id_commande", "id_users", "id_produit", "quantite", "prix_unitaire", "date_commande", "statut",
+}
+
+
+class SchemaCaps:
+    def __init__(self, tables: dict[str, str], order_columns: set[str], case_insensitive: bool):
+        # tables: lowercased name -> actual name
+        self.order_table = tables.get("commande")
+        self.product_table = tables.get("produit", "Produit")
+        self.users_table = tables.get("utilisateurs")
+        self.has_id_commande = "id_commande" in order_columns
+        self.has_statut = "statut" in order_columns
+        self.has_prix_unitaire = "prix_unitaire" in order_columns
+
+        # The ORM models use the capitalized names; that only matters where
+        # table names are case-sensitive (MySQL on Linux)
+        def orm_ok(actual: str | None, expected: str) -> bool:
+            return actual is not None and (case_insensitive or actual == expected)
+
+        self.orm_orders = orm_ok(self.order_table, "Commande") and _CANONICAL_ORDER_COLUMNS <= order_columns
+        self.orm_users = orm_ok(self.users_table, "Utilisateurs")
+
+        # Raw SQL row shape for non-canonical order tables: one SELECT built
+        # from the columns that exist, aliased to the OrderRowOut fields
+        def first_of(*names: str) -> str:
+            present = [n for n in names if n in order_columns]
+            if not present:
+                return "NULL"
+            return present[0] if len(present) == 1 else f"COALESCE({', '.join(present)})"
+
+        self.order_id_column = "id_commande" if self.has_id_commande else None
+        self.order_date_expr = first_of("date_commande", "date_creation")
+        self.order_status_expr = "statut" if self.has_statut else None
+        self.order_select = (
+            f"SELECT {self.order_id_column or 'NULL'} AS id_commande, id_users, id_produit, quantite, "
+            f"{first_of('prix_unitaire', 'prix')} AS prix_unitaire, "
+            f"{self.order_date_expr} AS date_commande, "
+            f"{self.order_status_expr or 'NULL'} AS statut "
+            f"FROM {self.order_table}"
+        )
+
+
+_caps: SchemaCaps | None = None
+
+
+def detect(engine: Engine) -> SchemaCaps:
+    """Inspect the database once and remember what it supports."""
+    global _caps
+    inspector = inspect(engine)
+    tables = {name.lower(): name for name in inspector.get_table_names()}
+    order_columns: set[str] = set()
+    if "commande" in tables:
+        order_columns = {c["name"].lower() for c in inspector.get_columns(tables["commande"])}
+    _caps = SchemaCaps(tables, order_columns, case_insensitive=engine.dialect.name == "sqlite")
+    return _caps
+
+
+def caps() -> SchemaCaps:
+    """Detected capabilities; detects lazily if startup didn't run (e.g. scripts)."""
+    if _caps is None:
+        from .database import engine
+        return detect(engine)
+    return _caps
@@ -0,0 +1,357 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, or_, insert, delete, select, func, and_
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from . import models, catalogue
+
+
+# Stock reservations for cart lines.
+# Adding to a cart takes the quantity out of Produit.stock right away and
+# records a hold that expires after RESERVATION_TTL_SECONDS. Checkout turns
+# the cart's holds into the order (only quantities not covered by a hold are
+# taken from stock then). A background sweeper gives expired holds back to
+# stock in batches.
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "30"))
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", "500"))
+
+# Inventory ledger.
+# Every stock change appends MouvementStock rows; Produit.stock is the
+# materialized running total, moved by the same delta in the same
+# transaction (never overwritten). The background thread also writes a
+# SnapshotStock row per product that moved every STOCK_SNAPSHOT_INTERVAL
+# seconds, so point-in-time reads only sum the movements after a snapshot.
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "3600"))
+# Snapshots only cover movements older than this many seconds. Ids are
+# assigned at insert but may commit out of order (InnoDB auto-increment), so
+# a movement below the newest id can still be in flight; it must not fall
+# under a snapshot before it commits. Keep it well above any transaction's
+# duration.
+STOCK_SNAPSHOT_GRACE = float(os.getenv("STOCK_SNAPSHOT_GRACE", "300"))
+
+Movement = models.MovementType
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, product_ids: list[int]):
+        super().__init__("Insufficient stock")
+        self.product_ids = product_ids
+
+
+_produit = models.Produit.__table__
+# Take stock only if enough remains; NULL stock means the product isn't stock-tracked
+_TAKE_STOCK = (
+    _produit.update()
+    .where(
+        _produit.c.id_produit == bindparam("pid"),
+        or_(_produit.c.stock.is_(None), _produit.c.stock >= bindparam("qty")),
+    )
+    .values(stock=_produit.c.stock - bindparam("qty"))
+)
+_ADD_STOCK = (
+    _produit.update()
+    .where(_produit.c.id_produit == bindparam("pid"))
+    .values(stock=_produit.c.stock + bindparam("qty"))
+)
+
+
+def _lines(quantities: dict[int, int]) -> list[dict]:
+    # Id order keeps row-lock order stable across concurrent transactions
+    return [{"pid": pid, "qty": qty} for pid, qty in sorted(quantities.items()) if qty > 0]
+
+
+def record(db: Session, kind: models.MovementType, deltas: dict[int, int], id_commande: int | None = None) -> None:
+    """Append ledger rows (id_produit -> signed quantity) without touching Produit.stock.
+
+    Only for stock already applied to the projection, e.g. a new product's
+    initial stock. Everything else goes through take_stock/add_stock.
+    """
+    now = datetime.utcnow()
+    rows = [
+        dict(id_produit=pid, type=kind, quantite=qty, id_commande=id_commande, date_mouvement=now)
+        for pid, qty in sorted(deltas.items()) if qty
+    ]
+    if rows:
+        db.execute(insert(models.MouvementStock), rows)
+
+
+def _take(db: Session, quantities: dict[int, int]) -> None:
+    lines = _lines(quantities)
+    if not lines:
+        return
+    result = db.connection().execute(_TAKE_STOCK, lines)
+    if result.rowcount == len(lines):
+        return
+    stocks = dict(
+        db.query(models.Produit.id_produit, models.Produit.stock)
+        .filter(models.Produit.id_produit.in_([line["pid"] for line in lines]))
+    )
+    short = [
+        line["pid"] for line in lines
+        if line["pid"] not in stocks or (stocks[line["pid"]] is not None and stocks[line["pid"]] < line["qty"])
+    ]
+    raise InsufficientStock(short)
+
+
+def _add(db: Session, quantities: dict[int, int]) -> None:
+    lines = _lines(quantities)
+    if lines:
+        db.connection().execute(_ADD_STOCK, lines)
+
+
+def take_stock(db: Session, quantities: dict[int, int], kind=Movement.sale, id_commande: int | None = None) -> None:
+    """Atomically decrement stock for every line (id_produit -> quantity).
+
+    Each line is a conditional UPDATE, so concurrent buyers cannot both take
+    the last units. Raises InsufficientStock if any line can't be satisfied;
+    the caller must then roll back.
+    """
+    _take(db, quantities)
+    record(db, kind, {pid: -qty for pid, qty in quantities.items()}, id_commande)
+
+
+def add_stock(db: Session, quantities: dict[int, int], kind=Movement.release, id_commande: int | None = None) -> None:
+    _add(db, quantities)
+    record(db, kind, quantities, id_commande)
+
+
+def set_stock(db: Session, id_produit: int, stock: int) -> None:
+    """Bring a product's stock to an absolute level with an adjustment movement."""
+    # Lock the row before reading it, or a hold committing in between is lost
+    # from the adjustment. A no-op write locks the row on MySQL and the whole
+    # database on SQLite, which ignores FOR UPDATE.
+    db.execute(_produit.update().where(_produit.c.id_produit == id_produit).values(stock=_produit.c.stock))
+    current = db.query(models.Produit.stock).filter(models.Produit.id_produit == id_produit).scalar()
+    db.execute(_produit.update().where(_produit.c.id_produit == id_produit).values(stock=stock))
+    record(db, Movement.adjustment, {id_produit: stock - (current or 0)})
+
+
+def hold(db: Session, id_panier: int, id_produit: int, quantite: int) -> None:
+    """Reserve stock for a cart line and (re)start its expiry timer."""
+    if quantite <= 0:
+        return
+    take_stock(db, {id_produit: quantite}, Movement.reservation)
+    expires = datetime.utcnow() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    existing = (
+        db.query(models.Reservation)
+        .filter(models.Reservation.id_panier == id_panier, models.Reservation.id_produit == id_produit)
+        .first()
+    )
+    if existing:
+        existing.quantite += quantite
+        existing.date_expiration = expires
+    else:
+        db.add(models.Reservation(
+            id_panier=id_panier,
+            id_produit=id_produit,
+            quantite=quantite,
+            date_expiration=expires,
+        ))
+
+
+def _delete_holds(db: Session, rows: list[models.Reservation]) -> tuple[dict[int, int], int]:
+    """Delete the given holds; returns (quantities per product, holds deleted).
+
+    Only what this DELETE actually removed counts. A checkout, a cart clear
+    and the sweeper can all select the same hold (on SQLite the SELECT takes
+    no lock); whoever deletes it first owns its stock, the others get nothing.
+    """
+    r = models.Reservation
+    ids = [row.id_reservation for row in rows]
+    if not ids:
+        return {}, 0
+    if db.get_bind().dialect.delete_returning:
+        deleted = db.execute(
+            delete(r).where(r.id_reservation.in_(ids)).returning(r.id_produit, r.quantite)
+            .execution_options(synchronize_session=False)
+        ).all()
+    else:
+        deleted = [
+            (row.id_produit, row.quantite) for row in rows
+            if db.execute(
+                delete(r).where(r.id_reservation == row.id_reservation)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        ]
+    held: dict[int, int] = {}
+    for pid, qty in deleted:
+        held[pid] = held.get(pid, 0) + (qty or 0)
+    return held, len(deleted)
+
+
+def consume_holds(db: Session, id_panier: int) -> dict[int, int]:
+    """Delete a cart's holds and return the quantities they covered per product.
+
+    Expired holds the sweeper hasn't released yet still count: their stock
+    was never given back.
+    """
+    rows = (
+        db.query(models.Reservation)
+        .filter(models.Reservation.id_panier == id_panier)
+        .with_for_update()
+        .all()
+    )
+    return _delete_holds(db, rows)[0]
+
+
+def release_holds(db: Session, id_panier: int) -> dict[int, int]:
+    """Give a cart's held stock back, e.g. when the cart is cleared."""
+    held = consume_holds(db, id_panier)
+    add_stock(db, held, Movement.release)
+    return held
+
+
+def checkout(db: Session, id_panier: int, quantities: dict[int, int]) -> None:
+    """Turn a cart's holds into sold stock for `quantities` (id_produit -> qty).
+
+    Held quantities are used as-is; only the part not covered by a hold is
+    taken from stock, and any excess hold is returned. The ledger records
+    the holds as released and the full quantities as sold.
+    """
+    held = consume_holds(db, id_panier)
+    shortfall = {pid: qty - held.get(pid, 0) for pid, qty in quantities.items() if qty > held.get(pid, 0)}
+    surplus = {pid: qty - quantities.get(pid, 0) for pid, qty in held.items() if qty > quantities.get(pid, 0)}
+    _take(db, shortfall)
+    _add(db, surplus)
+    record(db, Movement.release, held)
+    record(db, Movement.sale, {pid: -qty for pid, qty in quantities.items()})
+
+
+def sweep_expired(db: Session, batch: int = RESERVATION_SWEEP_BATCH) -> int:
+    """Release one batch of expired holds; returns how many were released."""
+    rows = (
+        db.query(models.Reservation)
+        .filter(models.Reservation.date_expiration < datetime.utcnow())
+        .order_by(models.Reservation.id_reservation)
+        .limit(batch)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        return 0
+    released, count = _delete_holds(db, rows)
+    add_stock(db, released, Movement.release)
+    catalogue.commit_stock(db, released)
+    return count
+
+
+def open_ledger(db: Session) -> int:
+    """Give products without any ledger row an opening movement for their stock."""
+    rows = (
+        db.query(models.Produit.id_produit, models.Produit.stock)
+        .filter(
+            models.Produit.stock.isnot(None),
+            models.Produit.id_produit.not_in(select(models.MouvementStock.id_produit)),
+        )
+        .all()
+    )
+    record(db, Movement.opening, dict(rows))
+    db.commit()
+    return len(rows)
+
+
+def snapshot_stock(db: Session) -> int:
+    """Snapshot every product whose ledger moved since its last snapshot.
+
+    New levels are computed from the ledger alone (previous snapshot plus
+    the movements up to a high-water mark), so this never blocks writers.
+    The mark is the newest movement older than STOCK_SNAPSHOT_GRACE, so
+    every movement below it has committed. Returns the number of snapshots
+    written.
+    """
+    mv, snap = models.MouvementStock, models.SnapshotStock
+    settled = datetime.utcnow() - timedelta(seconds=STOCK_SNAPSHOT_GRACE)
+    # Walks the primary key from the newest row; only the grace window is read
+    high = (
+        db.query(mv.id_mouvement)
+        .filter(mv.date_mouvement <= settled)
+        .order_by(mv.id_mouvement.desc())
+        .limit(1)
+        .scalar()
+    )
+    if high is None:
+        return 0
+    latest = (
+        select(snap.id_produit, func.max(snap.id_mouvement).label("id_mouvement"))
+        .group_by(snap.id_produit)
+        .subquery()
+    )
+    previous = dict(
+        db.query(snap.id_produit, snap.stock)
+        .join(latest, and_(latest.c.id_produit == snap.id_produit, latest.c.id_mouvement == snap.id_mouvement))
+    )
+    deltas = (
+        db.query(mv.id_produit, func.sum(mv.quantite))
+        .outerjoin(latest, latest.c.id_produit == mv.id_produit)
+        .filter(mv.id_mouvement > func.coalesce(latest.c.id_mouvement, 0), mv.id_mouvement <= high)
+        .group_by(mv.id_produit)
+        .all()
+    )
+    now = datetime.utcnow()
+    rows = [
+        dict(id_produit=pid, id_mouvement=high, stock=previous.get(pid, 0) + int(delta or 0), date_snapshot=now)
+        for pid, delta in deltas
+    ]
+    if rows:
+        db.execute(insert(snap), rows)
+    db.commit()
+    return len(rows)
+
+
+def stock_at(db: Session, id_produit: int, at: datetime) -> int:
+    """Stock of a product as of `at`: latest snapshot before it plus later movements."""
+    mv, snap = models.MouvementStock, models.SnapshotStock
+    base = (
+        db.query(snap.stock, snap.id_mouvement)
+        .filter(snap.id_produit == id_produit, snap.date_snapshot <= at)
+        .order_by(snap.id_mouvement.desc())
+        .first()
+    )
+    stock, after = base if base else (0, 0)
+    delta = (
+        db.query(func.sum(mv.quantite))
+        .filter(mv.id_produit == id_produit, mv.id_mouvement > after, mv.date_mouvement <= at)
+        .scalar()
+    )
+    return stock + int(delta or 0)
+
+
+_stop = threading.Event()
+_worker: threading.Thread | None = None
+
+
+def _maintenance_loop():
+    next_snapshot = time.monotonic() + STOCK_SNAPSHOT_INTERVAL
+    while not _stop.wait(RESERVATION_SWEEP_INTERVAL):
+        db = SessionLocal()
+        try:
+            # Drain in batches so one sweep never holds locks on many rows
+            while sweep_expired(db) == RESERVATION_SWEEP_BATCH and not _stop.is_set():
+                pass
+            if time.monotonic() >= next_snapshot:
+                snapshot_stock(db)
+                next_snapshot = time.monotonic() + STOCK_SNAPSHOT_INTERVAL
+        except Exception:
+            # Try again next interval (e.g. database busy)
+            db.rollback()
+        finally:
+            db.close()
+
+
+def start_maintenance() -> None:
+    """Start the thread that sweeps expired holds and snapshots stock."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_maintenance_loop, name="inventory-maintenance", daemon=True)
+    _worker.start()
+
+
+def stop_maintenance() -> None:
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
@@ -3,9 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 from .routers import router as api_router
-from .database import engine
-from . import models
-from sqlalchemy import text
+from .database import engine, SessionLocal
+from . import database, search, catalogue, inventory, introspect, migrations, security
 from sqlalchemy.orm import Session
 import os
 
@@ -23,6 +22,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 @app.get("/health")
@@ -30,6 +30,15 @@ def health():
     return {"status": "ok"}
 
 
+if database.ASYNC_DB:
+    # Registered first so they take precedence over their sync counterparts
+    from .async_routers import router as async_router
+    app.include_router(async_router, prefix="")
+    _async_routes = {(r.path, frozenset(r.methods)) for r in async_router.routes}
+    api_router.routes[:] = [
+        r for r in api_router.routes if (r.path, frozenset(getattr(r, "methods", None) or ())) not in _async_routes
+    ]
+
 app.include_router(api_router, prefix="")
 
 # Mount static files for uploaded images
@@ -40,32 +49,43 @@ if os.path.exists(uploads_dir):
 
 @app.on_event("startup")
 def on_startup():
-    # Auto-create tables for SQLite (and others if desired)
-    models.Base.metadata.create_all(bind=engine)
-    # Lightweight SQLite migration to support admin orders page on legacy schemas
+    # Create tables and apply pending schema migrations (one query when current)
+    migrations.run(engine)
+    # Full-text product search; without it search falls back to LIKE
     try:
-        with engine.connect() as conn:
-            # Detect existing columns on Commande
-            cols = conn.execute(text("PRAGMA table_info(Commande)")).fetchall()
-            col_names = {c[1].lower() for c in cols}
-
-            # Add 'statut' column if missing
-            if 'statut' not in col_names:
-                conn.execute(text("ALTER TABLE Commande ADD COLUMN statut TEXT"))
-                # Default existing rows to 'pending'
-                conn.execute(text("UPDATE Commande SET statut = 'pending' WHERE statut IS NULL"))
-
-            # Add 'id_commande' column if missing, backfill from rowid
-            if 'id_commande' not in col_names:
-                conn.execute(text("ALTER TABLE Commande ADD COLUMN id_commande INTEGER"))
-                # Backfill using SQLite rowid for stable identifiers
-                conn.execute(text("UPDATE Commande SET id_commande = rowid WHERE id_commande IS NULL"))
-                # Create a unique index to mimic identifier behavior
-                conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_commande_id ON Commande(id_commande)"))
-            conn.commit()
+        search.ensure_search_index(engine)
     except Exception:
-        # Do not block startup on optional migration
         pass
+    # Detect table casing and order columns once; order endpoints pick their queries from it
+    introspect.detect(engine)
+
+    db = SessionLocal()
+    try:
+        catalogue.ensure_version(db)
+        # Products that predate the inventory ledger start with an opening balance
+        inventory.open_ledger(db)
+        # Optional in-memory catalogue read model
+        if catalogue.CATALOGUE_CACHE:
+            catalogue.load(db)
+    finally:
+        db.close()
+    # Expired cart reservations and stock snapshots are handled in the background
+    inventory.start_maintenance()
+    # Version bumps for cart/checkout stock changes, coalesced
+    catalogue.start_maintenance()
+    # PRAGMA optimize / WAL checkpoints when the SQLite tuning profile is on
+    database.start_maintenance()
+    # bcrypt cost for this host, then the worker processes for signup/login
+    security.calibrate_hasher()
+    security.start_hasher()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    inventory.stop_maintenance()
+    catalogue.stop_maintenance()
+    database.stop_maintenance()
+    security.stop_hasher()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
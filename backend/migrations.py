@@ -0,0 +1,238 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from . import models
+
+
+# Versioned schema migrations, applied by the startup hook.
+# Applied versions are recorded in schema_version; when the database is
+# current, startup costs a single SELECT. Workers starting together are
+# serialized: on MySQL by a named lock, on SQLite by an exclusive lock on a
+# file next to the database. Whoever waited re-reads schema_version and finds
+# the work done. Migrations still check before altering, for databases
+# changed by hand.
+# Backfills run in batches of MIGRATION_BATCH_SIZE rows, each in its own
+# transaction, so large tables are never locked for the whole update.
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "60"))
+
+_LOCK_NAME = "catalogue_schema_migrations"
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP NOT NULL
+    )
+"""
+
+
+def _table(engine: Engine, name: str) -> str | None:
+    """Actual name of a table whatever its casing, or None if it doesn't exist."""
+    return {t.lower(): t for t in inspect(engine).get_table_names()}.get(name.lower())
+
+
+def _columns(engine: Engine, table: str) -> set[str]:
+    return {c["name"].lower() for c in inspect(engine).get_columns(table)}
+
+
+def backfill(engine: Engine, table: str, assignment: str, condition: str, batch: int | None = None) -> int:
+    """UPDATE table SET assignment WHERE condition, in committed batches.
+
+    `condition` must stop matching once a row is updated, or this never ends.
+    Returns the number of rows updated.
+    """
+    batch = batch or MIGRATION_BATCH_SIZE
+    if engine.dialect.name == "sqlite":
+        stmt = text(
+            f"UPDATE {table} SET {assignment} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} WHERE {condition} LIMIT :batch)"
+        )
+    else:
+        stmt = text(f"UPDATE {table} SET {assignment} WHERE {condition} LIMIT :batch")
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            updated = conn.execute(stmt, {"batch": batch}).rowcount
+        total += updated
+        if updated < batch:
+            return total
+
+
+def _create_tables(engine: Engine) -> None:
+    models.Base.metadata.create_all(bind=engine)
+
+
+def _produit_listing_indexes(engine: Engine) -> None:
+    # create_all skips indexes on tables that already exist
+    for index in models.Produit.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def _commande_statut(engine: Engine) -> None:
+    table = _table(engine, "Commande")
+    if table is None or "statut" in _columns(engine, table):
+        return
+    column_type = "TEXT" if engine.dialect.name == "sqlite" else "ENUM('pending','completed','canceled')"
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN statut {column_type}"))
+    # Existing orders default to 'pending'
+    backfill(engine, table, "statut = 'pending'", "statut IS NULL")
+
+
+def _commande_id(engine: Engine) -> None:
+    table = _table(engine, "Commande")
+    if table is None or "id_commande" in _columns(engine, table):
+        return
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN id_commande INTEGER"))
+        # Stable identifiers from SQLite's rowid
+        backfill(engine, table, "id_commande = rowid", "id_commande IS NULL")
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_commande_id ON {table}(id_commande)"))
+    else:
+        # MySQL numbers existing rows itself when adding an AUTO_INCREMENT key
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN id_commande INT NOT NULL AUTO_INCREMENT UNIQUE"))
+
+
+def _create_indexes(engine: Engine, model) -> None:
+    """Create a model's declared indexes that are missing from its live table.
+
+    Goes through the actual table name (casing differs between deployments)
+    and skips indexes on columns a legacy table doesn't have.
+    """
+    table = _table(engine, model.__tablename__)
+    if table is None:
+        return
+    columns = _columns(engine, table)
+    existing = {i["name"].lower() for i in inspect(engine).get_indexes(table) if i.get("name")}
+    for index in model.__table__.indexes:
+        names = [c.name for c in index.columns]
+        if index.name.lower() in existing or not {n.lower() for n in names} <= columns:
+            continue
+        unique = "UNIQUE " if index.unique else ""
+        # MySQL has no IF NOT EXISTS for indexes; it relies on the migration lock
+        if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "sqlite" else ""
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE {unique}INDEX {if_not_exists}{index.name} ON {table} ({', '.join(names)})"))
+
+
+def _cart_order_indexes(engine: Engine) -> None:
+    for model in (models.Panier, models.Stocker, models.Commande):
+        _create_indexes(engine, model)
+    # Superseded by ix_Stocker_id_panier_id_produit
+    table = _table(engine, "Stocker")
+    if table is not None and "ix_stocker_id_panier" in {
+        (i.get("name") or "").lower() for i in inspect(engine).get_indexes(table)
+    }:
+        with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                conn.execute(text("DROP INDEX IF EXISTS ix_Stocker_id_panier"))
+            else:
+                conn.execute(text(f"DROP INDEX ix_Stocker_id_panier ON {table}"))
+
+
+# (version, name, function), in order. Append only; never renumber.
+MIGRATIONS = [
+    (1, "create_tables", _create_tables),
+    (2, "produit_listing_indexes", _produit_listing_indexes),
+    (3, "commande_statut", _commande_statut),
+    (4, "commande_id", _commande_id),
+    (5, "cart_order_indexes", _cart_order_indexes),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(engine: Engine) -> int | None:
+    """Highest applied version, or None when schema_version doesn't exist yet."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except Exception:
+        return None
+
+
+def _record(engine: Engine, version: int, name: str) -> None:
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()},
+            )
+    except IntegrityError:
+        # Another worker recorded it first
+        pass
+
+
+def _apply_pending(engine: Engine) -> list[int]:
+    with engine.begin() as conn:
+        conn.execute(text(_CREATE_VERSION_TABLE))
+    with engine.connect() as conn:
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+    done = []
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        migration(engine)
+        _record(engine, version, name)
+        done.append(version)
+    return done
+
+
+@contextmanager
+def _sqlite_lock(engine: Engine):
+    """Exclusive lock on <database>.migrations.lock, for SQLite files."""
+    database = engine.url.database
+    if not database or database == ":memory:" or database.startswith("file:"):
+        yield
+        return
+    with open(f"{database}.migrations.lock", "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock = lambda: msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            unlock = lambda: msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            lock = lambda: fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            unlock = lambda: fcntl.flock(lock_file, fcntl.LOCK_UN)
+        deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+        while True:
+            try:
+                lock()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError("Timed out waiting for the schema migration lock")
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            unlock()
+
+
+def run(engine: Engine) -> list[int]:
+    """Apply pending migrations; returns the versions applied by this call."""
+    if current_version(engine) == LATEST:
+        return []
+    if engine.dialect.name == "sqlite":
+        with _sqlite_lock(engine):
+            return _apply_pending(engine)
+    if engine.dialect.name not in ("mysql", "mariadb"):
+        return _apply_pending(engine)
+    # Session-level lock: held across the per-batch transactions
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": _LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}
+        ).scalar():
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            return _apply_pending(engine)
+        finally:
+            lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
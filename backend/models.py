@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DECIMAL, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DECIMAL, TIMESTAMP, Boolean, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
@@ -42,14 +42,14 @@ class Produit(Base):
     __tablename__ = "Produit"
 
     id_produit = Column(Integer, primary_key=True, autoincrement=True)
-    id_categorie = Column(Integer, ForeignKey("Categorie.id_categorie"), nullable=False)
-    id_marque = Column(Integer, ForeignKey("Marque.id_marque"), nullable=False)
+    id_categorie = Column(Integer, ForeignKey("Categorie.id_categorie"), nullable=False, index=True)
+    id_marque = Column(Integer, ForeignKey("Marque.id_marque"), nullable=False, index=True)
     nom = Column(String(100))
     description = Column(String(255))
-    prix = Column(DECIMAL(10, 2))
+    prix = Column(DECIMAL(10, 2), index=True)
     stock = Column(Integer)
     qr_code_path = Column(String(255))
-    date_creation = Column(TIMESTAMP)
+    date_creation = Column(TIMESTAMP, index=True)
     reste = Column(Integer)
 
     categorie = relationship("Categorie", back_populates="produits")
@@ -58,6 +58,8 @@ class Produit(Base):
 
 class Panier(Base):
     __tablename__ = "Panier"
+    # A user's latest cart: WHERE id_users = ? ORDER BY id_panier DESC
+    __table_args__ = (Index("ix_Panier_id_users_id_panier", "id_users", "id_panier"),)
 
     id_panier = Column(Integer, primary_key=True, autoincrement=True)
     id_users = Column(Integer, ForeignKey("Utilisateurs.id_users"), nullable=False)
@@ -72,21 +74,99 @@ class OrderStatus(str, enum.Enum):
 
 class Commande(Base):
     __tablename__ = "Commande"
+    # Order listings filter on one of these and page by id_commande
+    __table_args__ = (
+        Index("ix_Commande_id_users_id_commande", "id_users", "id_commande"),
+        Index("ix_Commande_statut_id_commande", "statut", "id_commande"),
+    )
 
     id_commande = Column(Integer, primary_key=True, autoincrement=True)
     id_users = Column(Integer, ForeignKey("Utilisateurs.id_users"), nullable=False)
-    id_produit = Column(Integer, ForeignKey("Produit.id_produit"), nullable=False)
+    id_produit = Column(Integer, ForeignKey("Produit.id_produit"), nullable=False, index=True)
     quantite = Column(Integer)
     prix_unitaire = Column(DECIMAL(10, 2))
-    date_commande = Column(TIMESTAMP)
+    date_commande = Column(TIMESTAMP, index=True)
     statut = Column(Enum(OrderStatus), default=OrderStatus.pending)
 
 
+class CatalogueVersion(Base):
+    """Single-row counter bumped by every write that changes catalogue listings."""
+    __tablename__ = "CatalogueVersion"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class ProduitChange(Base):
+    """Append-only log of product writes, tagged with the catalogue version.
+
+    Deleted products leave a tombstone (deleted=True), so there is no
+    foreign key to Produit.
+    """
+    __tablename__ = "ProduitChange"
+
+    id_change = Column(Integer, primary_key=True, autoincrement=True)
+    id_produit = Column(Integer, nullable=False, index=True)
+    version = Column(Integer, nullable=False, index=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    date_changement = Column(TIMESTAMP)
+
+
+class Reservation(Base):
+    """Stock held for a cart line until date_expiration."""
+    __tablename__ = "Reservation"
+
+    id_reservation = Column(Integer, primary_key=True, autoincrement=True)
+    id_panier = Column(Integer, ForeignKey("Panier.id_panier"), nullable=False, index=True)
+    id_produit = Column(Integer, ForeignKey("Produit.id_produit"), nullable=False)
+    quantite = Column(Integer, nullable=False)
+    date_expiration = Column(TIMESTAMP, nullable=False, index=True)
+
+
+class MovementType(str, enum.Enum):
+    opening = "opening"
+    receipt = "receipt"
+    adjustment = "adjustment"
+    reservation = "reservation"
+    release = "release"
+    sale = "sale"
+    cancellation = "cancellation"
+
+
+class MouvementStock(Base):
+    """Append-only inventory ledger; quantite is signed (+ in, - out).
+
+    Produit.stock is the running total of these rows. Like ProduitChange,
+    rows outlive deleted products, so there is no foreign key.
+    """
+    __tablename__ = "MouvementStock"
+
+    id_mouvement = Column(Integer, primary_key=True, autoincrement=True)
+    id_produit = Column(Integer, nullable=False, index=True)
+    type = Column(Enum(MovementType), nullable=False)
+    quantite = Column(Integer, nullable=False)
+    id_commande = Column(Integer)
+    date_mouvement = Column(TIMESTAMP, nullable=False)
+
+
+class SnapshotStock(Base):
+    """Stock of a product after ledger row id_mouvement, for point-in-time reads."""
+    __tablename__ = "SnapshotStock"
+
+    id_snapshot = Column(Integer, primary_key=True, autoincrement=True)
+    id_produit = Column(Integer, nullable=False, index=True)
+    id_mouvement = Column(Integer, nullable=False)
+    stock = Column(Integer, nullable=False)
+    date_snapshot = Column(TIMESTAMP, nullable=False)
+
+
 class Stocker(Base):
     __tablename__ = "Stocker"
+    # Cart lines by cart, and one product's line in a cart
+    __table_args__ = (Index("ix_Stocker_id_panier_id_produit", "id_panier", "id_produit"),)
 
     id_stocker = Column(Integer, primary_key=True, autoincrement=True)
-    id_panier = Column(Integer, ForeignKey("Panier.id_panier"), index=True)
+    id_panier = Column(Integer, ForeignKey("Panier.id_panier"))
     id_produit = Column(Integer, ForeignKey("Produit.id_produit"))
     quantite_stock = Column(Integer)
     date_mise_a_jour = Column(TIMESTAMP)
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Token-bucket rate limits for the credential endpoints.
+# Every login/signup attempt costs a bcrypt hash, so attempts are limited per
+# client IP and per email before any hashing or database work. A bucket holds
+# up to BURST tokens and refills PER_MINUTE tokens a minute; an attempt takes
+# one token or is rejected with the time until the next one.
+# Buckets live in process memory by default. With several workers, set
+# RATE_LIMIT_SQLITE to a file path so they share one SQLite-backed store.
+AUTH_RATE_LIMIT = os.getenv("AUTH_RATE_LIMIT", "1").lower() in ("1", "true", "yes")
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "20"))
+LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "5"))
+SIGNUP_IP_BURST = int(os.getenv("SIGNUP_IP_BURST", "5"))
+SIGNUP_IP_PER_MINUTE = float(os.getenv("SIGNUP_IP_PER_MINUTE", "5"))
+SIGNUP_EMAIL_BURST = int(os.getenv("SIGNUP_EMAIL_BURST", "3"))
+SIGNUP_EMAIL_PER_MINUTE = float(os.getenv("SIGNUP_EMAIL_PER_MINUTE", "1"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_SQLITE = os.getenv("RATE_LIMIT_SQLITE", "")
+
+# (burst, tokens per minute) for each bucket kind
+LIMITS = {
+    "login:ip": (LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE),
+    "login:email": (LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE),
+    "signup:ip": (SIGNUP_IP_BURST, SIGNUP_IP_PER_MINUTE),
+    "signup:email": (SIGNUP_EMAIL_BURST, SIGNUP_EMAIL_PER_MINUTE),
+}
+
+
+def _refill(tokens: float, updated: float, now: float, burst: int, per_second: float) -> float:
+    return min(float(burst), tokens + max(0.0, now - updated) * per_second)
+
+
+def _take(tokens: float, per_second: float) -> tuple[float, float]:
+    """(tokens left, seconds to wait); waiting means the attempt is refused."""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / per_second if per_second > 0 else float("inf")
+
+
+class MemoryStore:
+    """Buckets in this process; least recently used keys are dropped first."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, burst: int, per_second: float, now: float) -> float:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens, wait = _take(_refill(tokens, updated, now, burst, per_second), per_second)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SqliteStore:
+    """Buckets in a SQLite file shared by all workers on the host."""
+
+    _PRUNE_EVERY = 1000
+    _IDLE_SECONDS = 3600
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_bucket "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; take() opens its own write transaction
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, burst: int, per_second: float, now: float) -> float:
+        conn = self._connect()
+        # IMMEDIATE: the read-modify-write must not interleave with other workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (float(burst), now)
+            tokens, wait = _take(_refill(tokens, updated, now, burst, per_second), per_second)
+            conn.execute(
+                "INSERT INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            self._calls += 1
+            if self._calls % self._PRUNE_EVERY == 0:
+                # Long-idle buckets are full again; dropping them changes nothing
+                conn.execute("DELETE FROM rate_bucket WHERE updated < ?", (now - self._IDLE_SECONDS,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+_store: MemoryStore | SqliteStore | None = None
+_store_lock = threading.Lock()
+
+
+def store() -> MemoryStore | SqliteStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SqliteStore(RATE_LIMIT_SQLITE) if RATE_LIMIT_SQLITE else MemoryStore(RATE_LIMIT_MAX_KEYS)
+        return _store
+
+
+def check(action: str, ip: str | None, email: str | None) -> float:
+    """Take one token from the IP and email buckets for `action` ("login"/"signup").
+
+    Returns 0 when the attempt may go ahead, otherwise the seconds until it
+    could.
+    """
+    if not AUTH_RATE_LIMIT:
+        return 0.0
+    now = time.time()
+    keys = [("ip", ip), ("email", (email or "").strip().lower())]
+    for kind, value in keys:
+        if not value:
+            continue
+        burst, per_minute = LIMITS[f"{action}:{kind}"]
+        if burst <= 0:
+            continue
+        wait = store().take(f"{action}:{kind}:{value}", burst, per_minute / 60, now)
+        if wait > 0:
+            return wait
+    return 0.0
@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from .database import get_db
-from . import models, schemas, security
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from sqlalchemy.orm import Session, contains_eager
+from .database import SessionLocal, get_db, get_read_db
+from . import models, schemas, security, search, catalogue, inventory, introspect, ratelimit
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select
+from sqlalchemy import select, insert, and_, or_, case, cast, func, bindparam, Integer
 from datetime import datetime
+from decimal import Decimal
 import os
+import math
+import time
 import uuid
+import threading
+from collections import OrderedDict
 from fastapi.staticfiles import StaticFiles
 
 
 auth_scheme = HTTPBearer(auto_error=False)
 
+# Keyset pagination for product listings
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", "50"))
+PRODUCTS_MAX_PAGE_SIZE = int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", "500"))
+# Same scheme for admin listings (carts, orders)
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "100"))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", "1000"))
+
 
 def _require_auth(credentials: HTTPAuthorizationCredentials | None) -> dict:
     if not credentials:
@@ -28,73 +40,546 @@ def _require_admin(payload: dict):
         raise HTTPException(status_code=403, detail="Admin only")
 
 
+class Principal:
+    """The authenticated caller, from a verified access token."""
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        sub = payload.get("sub")
+        self.user_id = int(sub) if isinstance(sub, str) else sub
+        self.role = payload.get("role")
+
+
+async def current_principal(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(auth_scheme),
+) -> Principal:
+    """Dependency resolving the caller once per request (kept on request.state).
+
+    Async only so FastAPI runs it inline instead of in the threadpool; token
+    checks are cached and fast.
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is None:
+        principal = Principal(_require_auth(credentials))
+        request.state.principal = principal
+    return principal
+
+
+async def current_user_id(principal: Principal = Depends(current_principal)) -> int:
+    return principal.user_id
+
+
+# Short-lived cache of /auth/me profiles, so the call the frontend makes on
+# every page load doesn't query Utilisateurs each time. Entries live
+# USER_CACHE_TTL seconds (0 disables); writes to a user must call
+# user_changed(). Other workers see such changes once their entry expires.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+_profiles: OrderedDict[int, tuple[schemas.UserResponse, float]] = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def user_changed(user_id: int) -> None:
+    with _profiles_lock:
+        _profiles.pop(user_id, None)
+
+
+def _user_profile(db: Session, user_id: int) -> schemas.UserResponse | None:
+    now = time.monotonic()
+    with _profiles_lock:
+        hit = _profiles.get(user_id)
+        if hit is not None and hit[1] > now:
+            _profiles.move_to_end(user_id)
+            return hit[0]
+    user = db.query(models.Utilisateurs).filter(models.Utilisateurs.id_users == user_id).first()
+    if not user:
+        return None
+    role = user.role.value if hasattr(user.role, "value") else str(user.role)
+    profile = schemas.UserResponse(id_users=user.id_users, nom=user.nom or "", email=user.email, role=role)
+    if USER_CACHE_TTL > 0:
+        with _profiles_lock:
+            _profiles[user_id] = (profile, now + USER_CACHE_TTL)
+            _profiles.move_to_end(user_id)
+            while len(_profiles) > USER_CACHE_SIZE:
+                _profiles.popitem(last=False)
+    return profile
+
+
+def _insufficient_stock(db: Session, exc: inventory.InsufficientStock) -> HTTPException:
+    db.rollback()
+    ids = ", ".join(str(pid) for pid in exc.product_ids) or "unknown"
+    return HTTPException(status_code=409, detail=f"Insufficient stock for product(s): {ids}")
+
+
+def _check_rate_limit(request: Request, action: str, email: str) -> None:
+    wait = ratelimit.check(action, request.client.host if request.client else None, email)
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def _hasher_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+
+
 router = APIRouter()
 
 
 @router.post("/auth/signup", response_model=schemas.AuthResponse)
-def signup(payload: schemas.SignupRequest, db: Session = Depends(get_db)):
+def signup(payload: schemas.SignupRequest, request: Request, db: Session = Depends(get_db)):
+    _check_rate_limit(request, "signup", payload.email)
     existing = db.query(models.Utilisateurs).filter(models.Utilisateurs.email == payload.email).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email already used")
     role_value = None
     if payload.role in ("admin", "client"):
         role_value = models.UserRole(payload.role)
+    # Don't hold a pooled connection while bcrypt runs
+    db.rollback()
+    try:
+        mdp_hash = security.hash_password_pooled(payload.password)
+    except security.PasswordHasherBusy:
+        raise _hasher_busy()
     user = models.Utilisateurs(
         nom=payload.nom,
         email=payload.email,
-        mdp_hash=security.hash_password(payload.password),
+        mdp_hash=mdp_hash,
         role=role_value or models.UserRole.client,
     )
     db.add(user)
     db.commit()
     db.refresh(user)
+    user_changed(user.id_users)
     role = user.role.value if hasattr(user.role, "value") else str(user.role)
     token = security.create_access_token(str(user.id_users), role)
     return schemas.AuthResponse(access_token=token, role=role, user_id=user.id_users, nom=user.nom or "", email=user.email)
 
 
+def _rehash_password(user_id: int, password: str, old_hash: str) -> None:
+    """Store a hash at the current cost, unless the password changed meanwhile."""
+    try:
+        new_hash = security.hash_password_pooled(password)
+    except security.PasswordHasherBusy:
+        # Try again at the next login
+        return
+    db = SessionLocal()
+    try:
+        db.query(models.Utilisateurs).filter(
+            models.Utilisateurs.id_users == user_id,
+            models.Utilisateurs.mdp_hash == old_hash,
+        ).update({"mdp_hash": new_hash}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
 @router.post("/auth/login", response_model=schemas.AuthResponse)
-def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
+def login(
+    payload: schemas.LoginRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    _check_rate_limit(request, "login", payload.email)
     user = db.query(models.Utilisateurs).filter(models.Utilisateurs.email == payload.email).first()
-    if not user or not security.verify_password(payload.password, user.mdp_hash or ""):
+    # Don't hold a pooled connection while bcrypt runs; user stays loaded
+    db.close()
+    try:
+        valid, outdated = (
+            security.check_password_pooled(payload.password, user.mdp_hash or "") if user else (False, False)
+        )
+    except security.PasswordHasherBusy:
+        raise _hasher_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if outdated:
+        # Hash cost differs from this host's calibration: re-hash after responding
+        background_tasks.add_task(_rehash_password, user.id_users, payload.password, user.mdp_hash)
     role = user.role.value if hasattr(user.role, "value") else str(user.role)
     token = security.create_access_token(str(user.id_users), role)
     return schemas.AuthResponse(access_token=token, role=role, user_id=user.id_users, nom=user.nom or "", email=user.email)
 
 
 @router.get("/auth/me", response_model=schemas.UserResponse)
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme), db: Session = Depends(get_db)):
-    payload = _require_auth(credentials)
-    user = db.query(models.Utilisateurs).filter(models.Utilisateurs.id_users == payload["sub"]).first()
-    if not user:
+def get_current_user(principal: Principal = Depends(current_principal), db: Session = Depends(get_db)):
+    profile = _user_profile(db, principal.user_id)
+    if profile is None:
         raise HTTPException(status_code=404, detail="User not found")
-    role = user.role.value if hasattr(user.role, "value") else str(user.role)
-    return schemas.UserResponse(
-        id_users=user.id_users,
-        nom=user.nom or "",
-        email=user.email,
-        role=role
-    )
+    return profile
+
+
+def _catalogue_cache(db: Session, request: Request, response: Response) -> dict | Response:
+    """Conditional GET for catalogue listings.
+
+    Returns a bodiless 304 when the client's ETag matches the current
+    catalogue version. Otherwise sets ETag/Cache-Control on `response` and
+    returns the headers for handlers that build their own Response. The
+    version is read through `db`, the session that will read the body, and
+    before it, so a body is never older than its ETag.
+    """
+    headers = catalogue.cache_headers(db)
+    if catalogue.not_modified(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return headers
 
 
 # Read-only lists
 @router.get("/categories", response_model=list[schemas.CategorieOut])
-def list_categories(db: Session = Depends(get_db)):
+def list_categories(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    headers = _catalogue_cache(db, request, response)
+    if isinstance(headers, Response):
+        return headers
+    snapshot = catalogue.current()
+    if snapshot is not None:
+        return Response(snapshot.categories_json, media_type="application/json", headers=headers)
     return db.query(models.Categorie).all()
 
 
 @router.get("/brands", response_model=list[schemas.MarqueOut])
-def list_brands(db: Session = Depends(get_db)):
+def list_brands(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    headers = _catalogue_cache(db, request, response)
+    if isinstance(headers, Response):
+        return headers
+    snapshot = catalogue.current()
+    if snapshot is not None:
+        return Response(snapshot.brands_json, media_type="application/json", headers=headers)
     return db.query(models.Marque).all()
 
 
+PRODUCT_SORTS = ("id", "price-asc", "price-desc", "newest", "popularity")
+
+
+def _product_filters(
+    q: str | None = None,
+    id_categorie: int | None = None,
+    id_marque: int | None = None,
+    min_prix: float | None = None,
+    max_prix: float | None = None,
+    since: datetime | None = None,
+) -> list:
+    """Build SQL filter clauses for the product search parameters.
+
+    Text search uses the full-text index when one is available; otherwise it
+    falls back to substring matching on product name/description and
+    category/brand names, so the query must join Categorie and Marque.
+    """
+    clauses = []
+    if q:
+        term = q.strip()
+        fulltext = search.match_clause(term) if term else None
+        if fulltext is not None:
+            clauses.append(fulltext)
+        elif term:
+            clauses.append(or_(
+                models.Produit.nom.icontains(term, autoescape=True),
+                models.Produit.description.icontains(term, autoescape=True),
+                models.Categorie.nom.icontains(term, autoescape=True),
+                models.Marque.nom.icontains(term, autoescape=True),
+            ))
+    if id_categorie is not None:
+        clauses.append(models.Produit.id_categorie == id_categorie)
+    if id_marque is not None:
+        clauses.append(models.Produit.id_marque == id_marque)
+    if min_prix is not None:
+        clauses.append(models.Produit.prix >= min_prix)
+    if max_prix is not None:
+        clauses.append(models.Produit.prix <= max_prix)
+    if since is not None:
+        clauses.append(models.Produit.date_creation >= since)
+    return clauses
+
+
+def _sort_spec(sort: str):
+    """Return (key column, descending, cursor value parser) for a sort name.
+
+    'newest' relies on id_produit being monotonic; date_creation is nullable
+    on legacy rows so it is used for filtering (`since`) but not for ordering.
+    """
+    if sort == "price-asc":
+        return models.Produit.prix, False, Decimal
+    if sort == "price-desc":
+        return models.Produit.prix, True, Decimal
+    if sort == "popularity":
+        return models.Produit.stock, True, int
+    if sort == "newest":
+        return None, True, None
+    return None, False, None
+
+
+def _keyset_clause(key, descending: bool, value, last_id: int):
+    """Rows strictly after (value, last_id) in ORDER BY key, id_produit.
+
+    NULL keys sort first ascending and last descending (SQLite and MySQL).
+    """
+    pk = models.Produit.id_produit
+    if key is None:
+        return pk < last_id if descending else pk > last_id
+    if value is None:
+        if descending:
+            return and_(key.is_(None), pk < last_id)
+        return or_(and_(key.is_(None), pk > last_id), key.isnot(None))
+    if descending:
+        return or_(key < value, and_(key == value, pk < last_id), key.is_(None))
+    return or_(key > value, and_(key == value, pk > last_id))
+
+
+def _parse_cursor(after: str, parse_value):
+    """Decode a cursor: '<id>' for id-ordered sorts, '<value>,<id>' otherwise."""
+    try:
+        if parse_value is None:
+            return None, int(after)
+        raw_value, raw_id = after.rsplit(",", 1)
+        return (parse_value(raw_value) if raw_value else None), int(raw_id)
+    except (ValueError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _encode_cursor(product: models.Produit, key) -> str:
+    if key is None:
+        return str(product.id_produit)
+    value = getattr(product, key.key)
+    return f"{'' if value is None else value},{product.id_produit}"
+
+
 @router.get("/products", response_model=list[schemas.ProduitWithDetails])
-def list_products(db: Session = Depends(get_db)):
-    products = db.query(models.Produit).all()
+def list_products(
+    request: Request,
+    response: Response,
+    after: str | None = None,
+    limit: int | None = Query(None, ge=1, le=PRODUCTS_MAX_PAGE_SIZE),
+    q: str | None = None,
+    id_categorie: int | None = None,
+    id_marque: int | None = None,
+    min_prix: float | None = Query(None, ge=0),
+    max_prix: float | None = Query(None, ge=0),
+    since: datetime | None = None,
+    sort: str = "id",
+    db: Session = Depends(get_read_db),
+):
+    """List products, optionally filtered and sorted in the database.
+
+    Without `after`/`limit` every matching product is returned (legacy
+    behaviour). Otherwise a single keyset page of at most `limit` rows is
+    returned and the cursor for the next page is sent in the X-Next-Cursor
+    header (absent on the last page). Cursors are only valid for the sort
+    they were issued with.
+    """
+    return _list_products(db, request, response, after, limit, q, id_categorie, id_marque, min_prix, max_prix, since, sort)
+
+
+def _list_products(db: Session, request: Request, response: Response, after, limit, q, id_categorie, id_marque, min_prix, max_prix, since, sort):
+    if sort not in PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort, expected one of {', '.join(PRODUCT_SORTS)}")
+    key, descending, parse_value = _sort_spec(sort)
+    headers = _catalogue_cache(db, request, response)
+    if isinstance(headers, Response):
+        return headers
+
+    # Unfiltered id-ordered reads are served from the in-memory read model
+    snapshot = catalogue.current()
+    unfiltered = not (q or since) and all(v is None for v in (id_categorie, id_marque, min_prix, max_prix))
+    if snapshot is not None and unfiltered and sort == "id":
+        if after is None and limit is None:
+            return Response(snapshot.products_json, media_type="application/json", headers=headers)
+        _, last_id = _parse_cursor(after, None) if after is not None else (None, None)
+        body, next_cursor = snapshot.page(last_id, limit or PRODUCTS_PAGE_SIZE)
+        out = Response(body, media_type="application/json", headers=headers)
+        if next_cursor is not None:
+            out.headers["X-Next-Cursor"] = str(next_cursor)
+        return out
+
+    pk = models.Produit.id_produit
+    order = [pk.desc() if descending else pk]
+    if key is not None:
+        order.insert(0, key.desc() if descending else key)
+
+    query = (
+        db.query(models.Produit)
+        .outerjoin(models.Produit.categorie)
+        .outerjoin(models.Produit.marque)
+        .options(contains_eager(models.Produit.categorie), contains_eager(models.Produit.marque))
+        .filter(*_product_filters(q, id_categorie, id_marque, min_prix, max_prix, since))
+        .order_by(*order)
+    )
+    if after is None and limit is None:
+        return query.all()
+    if after is not None:
+        value, last_id = _parse_cursor(after, parse_value)
+        query = query.filter(_keyset_clause(key, descending, value, last_id))
+    page_size = limit or PRODUCTS_PAGE_SIZE
+    # Fetch one extra row to know whether another page exists
+    products = query.limit(page_size + 1).all()
+    if len(products) > page_size:
+        products = products[:page_size]
+        response.headers["X-Next-Cursor"] = _encode_cursor(products[-1], key)
     return products
 
 
+@router.get("/products/search", response_model=list[schemas.ProduitWithDetails])
+def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=PRODUCTS_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Full-text product search, best matches first (BM25 on SQLite).
+
+    Every word is prefix-matched, so 'iph pro' finds 'iPhone 15 Pro'.
+    """
+    base = (
+        db.query(models.Produit)
+        .outerjoin(models.Produit.categorie)
+        .outerjoin(models.Produit.marque)
+        .options(contains_eager(models.Produit.categorie), contains_eager(models.Produit.marque))
+    )
+    ids = search.ranked_ids(db, q, limit)
+    if ids is None:
+        # No full-text index on this database: unranked substring search
+        return base.filter(*_product_filters(q)).order_by(models.Produit.id_produit).limit(limit).all()
+    if not ids:
+        return []
+    by_id = {p.id_produit: p for p in base.filter(models.Produit.id_produit.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@router.get("/products/changes", response_model=schemas.ProductChangesOut)
+def product_changes(since: int = Query(..., ge=0), db: Session = Depends(get_read_db)):
+    """Products inserted/updated and ids deleted after catalogue version `since`.
+
+    Clients store the returned `version` and pass it as `since` next time.
+    """
+    version = catalogue.read_version(db)
+    if since >= version:
+        return schemas.ProductChangesOut(version=version, upserted=[], deleted=[])
+    upserted_ids, deleted_ids = catalogue.changes_since(db, since, version)
+    products = []
+    if upserted_ids:
+        products = (
+            db.query(models.Produit)
+            .outerjoin(models.Produit.categorie)
+            .outerjoin(models.Produit.marque)
+            .options(contains_eager(models.Produit.categorie), contains_eager(models.Produit.marque))
+            .filter(models.Produit.id_produit.in_(upserted_ids))
+            .order_by(models.Produit.id_produit)
+            .all()
+        )
+    # A product updated in the window but deleted by a later, uncounted write
+    found = {p.id_produit for p in products}
+    deleted_ids += [pid for pid in upserted_ids if pid not in found]
+    return schemas.ProductChangesOut(version=version, upserted=products, deleted=sorted(deleted_ids))
+
+
+def _facet_rollup(rows, id_categorie, id_marque, bucket_size: float) -> schemas.ProductFacetsOut:
+    """Aggregate (cat id, cat name, brand id, brand name, bucket, in price range, count) rows.
+
+    Facets are disjunctive: each dimension's counts apply every filter except
+    its own, so the sidebar can show how many products each alternative
+    category, brand or price band would give.
+    """
+    total = 0
+    cats: dict[int, list] = {}
+    brands: dict[int, list] = {}
+    buckets: dict[int, int] = {}
+    for cat_id, cat_nom, brand_id, brand_nom, bucket, in_range, n in rows:
+        cat_ok = id_categorie is None or cat_id == id_categorie
+        brand_ok = id_marque is None or brand_id == id_marque
+        if brand_ok and in_range:
+            cats.setdefault(cat_id, [cat_nom, 0])[1] += n
+        if cat_ok and in_range:
+            brands.setdefault(brand_id, [brand_nom, 0])[1] += n
+        if cat_ok and brand_ok and bucket is not None:
+            buckets[bucket] = buckets.get(bucket, 0) + n
+        if cat_ok and brand_ok and in_range:
+            total += n
+    return schemas.ProductFacetsOut(
+        total=total,
+        categories=[schemas.FacetCount(id=k, nom=v[0], count=v[1]) for k, v in sorted(cats.items())],
+        brands=[schemas.FacetCount(id=k, nom=v[0], count=v[1]) for k, v in sorted(brands.items())],
+        prices=[
+            schemas.PriceBucket(min_prix=b * bucket_size, max_prix=(b + 1) * bucket_size, count=n)
+            for b, n in sorted(buckets.items())
+        ],
+    )
+
+
+@router.get("/products/facets", response_model=schemas.ProductFacetsOut)
+def product_facets(
+    q: str | None = None,
+    id_categorie: int | None = None,
+    id_marque: int | None = None,
+    min_prix: float | None = Query(None, ge=0),
+    max_prix: float | None = Query(None, ge=0),
+    since: datetime | None = None,
+    bucket_size: float = Query(100, gt=0),
+    db: Session = Depends(get_read_db),
+):
+    """Per-category, per-brand and price-bucket counts for a filter set.
+
+    Served from the read model's pre-aggregated counts when it is loaded
+    and no text or date filter is set; otherwise computed with a single
+    grouped query.
+    """
+    def price_ok(prix):
+        if prix is None:
+            return min_prix is None and max_prix is None
+        return (min_prix is None or prix >= min_prix) and (max_prix is None or prix <= max_prix)
+
+    snapshot = catalogue.current()
+    if snapshot is not None and not q and since is None:
+        counts: dict[tuple, int] = {}
+        # One pass over distinct (category, brand, price) keys, not products
+        for (cat_id, brand_id, prix), n in snapshot.facet_counts.items():
+            bucket = None if prix is None else int(prix // bucket_size)
+            key = (cat_id, brand_id, bucket, price_ok(prix))
+            counts[key] = counts.get(key, 0) + n
+        cat_names, brand_names = snapshot.category_names, snapshot.brand_names
+        rows = (
+            (c, cat_names.get(c), b, brand_names.get(b), bucket, ok, n)
+            for (c, b, bucket, ok), n in counts.items()
+        )
+        return _facet_rollup(rows, id_categorie, id_marque, bucket_size)
+
+    prix = models.Produit.prix
+    if db.bind.dialect.name == "sqlite":
+        # CAST truncates on SQLite (prices are non-negative), and floor() is
+        # only available in builds with math functions
+        bucket = cast(prix / bucket_size, Integer)
+    else:
+        bucket = func.floor(prix / bucket_size)
+    price_filters = []
+    if min_prix is not None:
+        price_filters.append(prix >= min_prix)
+    if max_prix is not None:
+        price_filters.append(prix <= max_prix)
+    group = [
+        models.Produit.id_categorie, models.Categorie.nom,
+        models.Produit.id_marque, models.Marque.nom,
+        bucket,
+    ]
+    # Price range is a flag rather than a WHERE clause so the price histogram
+    # can ignore it; without price filters every row is in range
+    if price_filters:
+        group.append(case((and_(*price_filters), 1), else_=0))
+    rows = (
+        db.query(*group, func.count())
+        .select_from(models.Produit)
+        .outerjoin(models.Produit.categorie)
+        .outerjoin(models.Produit.marque)
+        .filter(*_product_filters(q=q, since=since))
+        .group_by(*group)
+        .all()
+    )
+    rows = (
+        (r[0], r[1], r[2], r[3], None if r[4] is None else int(r[4]), bool(r[5]) if price_filters else True, r[-1])
+        for r in rows
+    )
+    return _facet_rollup(rows, id_categorie, id_marque, bucket_size)
+
+
 # Admin CRUD
 @router.post("/products", response_model=schemas.ProduitOut)
 def create_product(
@@ -104,10 +589,15 @@ def create_product(
 ):
     payload = _require_auth(credentials)
     _require_admin(payload)
-    prod = models.Produit(**product_data.dict())
+    prod = models.Produit(**product_data.dict(), date_creation=datetime.utcnow())
     db.add(prod)
+    db.flush()
+    inventory.record(db, models.MovementType.receipt, {prod.id_produit: prod.stock or 0})
+    version = catalogue.bump_version(db, [prod.id_produit])
     db.commit()
+    catalogue.set_version(version)
     db.refresh(prod)
+    catalogue.products_saved(db, [prod.id_produit])
     return prod
 
 
@@ -150,10 +640,17 @@ def update_product(
     if not prod:
         raise HTTPException(status_code=404, detail="Product not found")
     update_data = product_data.dict(exclude_unset=True)
+    # Stock goes through the inventory ledger instead of being overwritten
+    new_stock = update_data.pop("stock", None)
     for field, value in update_data.items():
         setattr(prod, field, value)
+    if new_stock is not None:
+        inventory.set_stock(db, prod.id_produit, new_stock)
+    version = catalogue.bump_version(db, [prod.id_produit])
     db.commit()
+    catalogue.set_version(version)
     db.refresh(prod)
+    catalogue.products_saved(db, [prod.id_produit])
     return prod
 
 
@@ -169,10 +666,61 @@ def delete_product(
     if not prod:
         raise HTTPException(status_code=404, detail="Product not found")
     db.delete(prod)
+    version = catalogue.bump_version(db, [id_produit], deleted=True)
     db.commit()
+    catalogue.set_version(version)
+    catalogue.product_deleted(id_produit)
     return {"ok": True}
 
 
+@router.post("/products/{id_produit}/stock", response_model=schemas.StockLevelOut)
+def record_stock_movement(
+    id_produit: int,
+    movement: schemas.StockMovementIn,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    db: Session = Depends(get_db),
+):
+    """Record a goods receipt or a manual adjustment in the inventory ledger."""
+    payload = _require_auth(credentials)
+    _require_admin(payload)
+    prod = db.query(models.Produit).get(id_produit)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Product not found")
+    kind = (movement.type or "").lower()
+    if kind not in ("receipt", "adjustment"):
+        raise HTTPException(status_code=400, detail="Invalid movement type")
+    if kind == "receipt" and movement.quantite <= 0:
+        raise HTTPException(status_code=400, detail="Receipt quantity must be positive")
+    try:
+        if movement.quantite >= 0:
+            inventory.add_stock(db, {id_produit: movement.quantite}, models.MovementType(kind))
+        else:
+            inventory.take_stock(db, {id_produit: -movement.quantite}, models.MovementType(kind))
+    except inventory.InsufficientStock as exc:
+        raise _insufficient_stock(db, exc)
+    catalogue.commit_products(db, [id_produit])
+    db.refresh(prod)
+    return schemas.StockLevelOut(id_produit=id_produit, stock=prod.stock, at=datetime.utcnow())
+
+
+@router.get("/products/{id_produit}/stock", response_model=schemas.StockLevelOut)
+def get_stock_level(
+    id_produit: int,
+    at: datetime | None = None,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    db: Session = Depends(get_db),
+):
+    """Current stock, or the stock as of `at` (UTC) rebuilt from the ledger."""
+    payload = _require_auth(credentials)
+    _require_admin(payload)
+    prod = db.query(models.Produit).get(id_produit)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if at is None:
+        return schemas.StockLevelOut(id_produit=id_produit, stock=prod.stock, at=datetime.utcnow())
+    return schemas.StockLevelOut(id_produit=id_produit, stock=inventory.stock_at(db, id_produit, at), at=at)
+
+
 @router.post("/categories", response_model=schemas.CategorieOut)
 def create_category(
     category_data: schemas.CategorieCreate,
@@ -183,8 +731,11 @@ def create_category(
     _require_admin(payload)
     cat = models.Categorie(**category_data.dict())
     db.add(cat)
+    version = catalogue.bump_version(db)
     db.commit()
+    catalogue.set_version(version)
     db.refresh(cat)
+    catalogue.taxonomy_changed(db)
     return cat
 
 
@@ -198,8 +749,11 @@ def create_brand(
     _require_admin(payload)
     brand = models.Marque(**brand_data.dict())
     db.add(brand)
+    version = catalogue.bump_version(db)
     db.commit()
+    catalogue.set_version(version)
     db.refresh(brand)
+    catalogue.taxonomy_changed(db)
     return brand
 
 
@@ -207,12 +761,13 @@ def create_brand(
 @router.post("/cart/add")
 def cart_add(
     item: schemas.CartAddItem,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
+    return _cart_add(db, user_id, item)
+
+
+def _cart_add(db: Session, user_id: int, item: schemas.CartAddItem) -> dict:
     # Get the most recent active cart for this user, or create a new one
     cart = db.query(models.Panier).filter(models.Panier.id_users == user_id).order_by(models.Panier.id_panier.desc()).first()
     if not cart:
@@ -245,17 +800,24 @@ def cart_add(
         )
         db.add(stock)
     
-    db.commit()
+    # Hold the added quantity until checkout or expiry
+    try:
+        inventory.hold(db, cart.id_panier, item.id_produit, max(1, item.quantite))
+    except inventory.InsufficientStock as exc:
+        raise _insufficient_stock(db, exc)
+    catalogue.commit_stock(db, [item.id_produit])
     return {"ok": True}
 
 
 @router.get("/cart", response_model=schemas.CartOut)
 def get_cart(
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
+    return _get_cart(db, user_id)
+
+
+def _get_cart(db: Session, user_id: int) -> schemas.CartOut:
     # Get the single active cart for this user (most recent one if multiple exist)
     cart = db.query(models.Panier).filter(models.Panier.id_users == user_id).order_by(models.Panier.id_panier.desc()).first()
     if not cart:
@@ -282,15 +844,14 @@ def get_cart(
 
 @router.post("/cart/clear")
 def clear_cart(
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
     cart = db.query(models.Panier).filter(models.Panier.id_users == user_id).order_by(models.Panier.id_panier.desc()).first()
     if not cart:
         return {"ok": True}
     
+    released = inventory.release_holds(db, cart.id_panier)
     # Delete all stocker items for this cart
     items = (
         db.query(models.Stocker)
@@ -302,52 +863,51 @@ def clear_cart(
     
     # Delete the cart itself
     db.delete(cart)
-    db.commit()
+    catalogue.commit_stock(db, released)
     return {"ok": True}
 
+def _carts_out(db: Session, carts: list[models.Panier]) -> list[schemas.CartOut]:
+    """Serialize carts with their lines, loading all lines in one query."""
+    lines: dict[int, list[schemas.CartItemOut]] = {cart.id_panier: [] for cart in carts}
+    if lines:
+        items = (
+            db.query(models.Stocker)
+            .filter(models.Stocker.id_panier.in_(list(lines)))
+            .order_by(models.Stocker.id_stocker)
+        )
+        for i in items:
+            lines[i.id_panier].append(
+                schemas.CartItemOut(
+                    id_produit=i.id_produit,
+                    quantite=i.quantite_stock or 0,
+                    date_mise_a_jour=i.date_mise_a_jour,
+                )
+            )
+    return [
+        schemas.CartOut(
+            id_panier=cart.id_panier,
+            id_users=cart.id_users,
+            items=lines[cart.id_panier],
+            date_creation=cart.date_creation,
+        )
+        for cart in carts
+    ]
+
+
 @router.get("/carts", response_model=list[schemas.CartOut])
 def get_user_carts(
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Get all carts for this user
     carts = db.query(models.Panier).filter(models.Panier.id_users == user_id).order_by(models.Panier.id_panier.desc()).all()
-    results: list[schemas.CartOut] = []
-    
-    for cart in carts:
-        items = (
-            db.query(models.Stocker)
-            .filter(models.Stocker.id_panier == cart.id_panier)
-            .all()
-        )
-        results.append(
-            schemas.CartOut(
-                id_panier=cart.id_panier,
-                id_users=cart.id_users,
-                items=[
-                    schemas.CartItemOut(
-                        id_produit=i.id_produit,
-                        quantite=i.quantite_stock or 0,
-                        date_mise_a_jour=i.date_mise_a_jour,
-                    )
-                    for i in items
-                ],
-                date_creation=cart.date_creation,
-            )
-        )
-    return results
+    return _carts_out(db, carts)
 
 @router.post("/cart/new")
 def create_new_cart(
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Create a new cart for this user
     cart = models.Panier(id_users=user_id, date_creation=datetime.utcnow())
     db.add(cart)
@@ -359,12 +919,9 @@ def create_new_cart(
 @router.delete("/cart/{cart_id}")
 def delete_cart(
     cart_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Verify the cart belongs to this user
     cart = db.query(models.Panier).filter(
         models.Panier.id_panier == cart_id,
@@ -374,6 +931,7 @@ def delete_cart(
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
+    released = inventory.release_holds(db, cart.id_panier)
     # Delete all stocker items for this cart
     items = (
         db.query(models.Stocker)
@@ -385,7 +943,7 @@ def delete_cart(
     
     # Delete the cart itself
     db.delete(cart)
-    db.commit()
+    catalogue.commit_stock(db, released)
     return {"ok": True}
 
 
@@ -393,12 +951,9 @@ def delete_cart(
 def add_to_specific_cart(
     cart_id: int,
     item: schemas.CartAddItem,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Verify the cart belongs to the user
     cart = db.query(models.Panier).filter(
         models.Panier.id_panier == cart_id,
@@ -432,19 +987,21 @@ def add_to_specific_cart(
         )
         db.add(stock)
     
-    db.commit()
+    # Hold the added quantity until checkout or expiry
+    try:
+        inventory.hold(db, cart_id, item.id_produit, item.quantite)
+    except inventory.InsufficientStock as exc:
+        raise _insufficient_stock(db, exc)
+    catalogue.commit_stock(db, [item.id_produit])
     return {"message": "Item added to cart successfully"}
 
 
 @router.get("/cart/{cart_id}", response_model=schemas.CartOut)
 def get_specific_cart(
     cart_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Verify the cart belongs to the user
     cart = db.query(models.Panier).filter(
         models.Panier.id_panier == cart_id,
@@ -478,12 +1035,9 @@ def get_specific_cart(
 @router.post("/cart/{cart_id}/clear")
 def clear_specific_cart(
     cart_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Verify the cart belongs to the user
     cart = db.query(models.Panier).filter(
         models.Panier.id_panier == cart_id,
@@ -493,22 +1047,28 @@ def clear_specific_cart(
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
+    released = inventory.release_holds(db, cart_id)
     # Delete all stocker items for this cart
     db.query(models.Stocker).filter(models.Stocker.id_panier == cart_id).delete()
-    db.commit()
+    catalogue.commit_stock(db, released)
     
     return {"message": "Cart cleared successfully"}
 
 
+def _products_by_id(db: Session, ids) -> dict[int, models.Produit]:
+    """Load the given products with a single IN query."""
+    ids = set(ids)
+    if not ids:
+        return {}
+    return {p.id_produit: p for p in db.query(models.Produit).filter(models.Produit.id_produit.in_(ids))}
+
+
 @router.post("/cart/{cart_id}/order")
 def create_order_from_cart(
     cart_id: int,
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
-    
     # Verify the cart belongs to the user
     cart = db.query(models.Panier).filter(
         models.Panier.id_panier == cart_id,
@@ -525,37 +1085,46 @@ def create_order_from_cart(
         raise HTTPException(status_code=400, detail="Cart is empty")
     
     # Create orders for each item (include unit price when available)
+    products = _products_by_id(db, [item.id_produit for item in items])
+    quantities: dict[int, int] = {}
+    for item in items:
+        if item.id_produit in products:
+            quantities[item.id_produit] = quantities.get(item.id_produit, 0) + (item.quantite_stock or 0)
+    try:
+        inventory.checkout(db, cart_id, quantities)
+    except inventory.InsufficientStock as exc:
+        raise _insufficient_stock(db, exc)
+    now = datetime.utcnow()
     orders = []
     for item in items:
-        prod = db.query(models.Produit).get(item.id_produit)
-        unit_price = float(prod.prix) if prod and prod.prix is not None else 0.0
-        order = models.Commande(
+        prod = products.get(item.id_produit)
+        orders.append(dict(
             id_users=user_id,
             id_produit=item.id_produit,
             quantite=item.quantite_stock,
-            prix_unitaire=unit_price,
-            statut="pending",
-            date_commande=datetime.utcnow()
-        )
-        orders.append(order)
-        db.add(order)
+            prix_unitaire=float(prod.prix) if prod and prod.prix is not None else 0.0,
+            statut=models.OrderStatus.pending,
+            date_commande=now,
+        ))
+    db.execute(insert(models.Commande), orders)
     
     # Clear the cart after creating orders
     db.query(models.Stocker).filter(models.Stocker.id_panier == cart_id).delete()
     db.delete(cart)
     
-    db.commit()
-    # Persist creations and deletions
-    db.commit()
+    # Stock is part of product listings
+    catalogue.commit_stock(db, quantities)
     return {"message": f"Order created successfully with {len(orders)} items"}
 
 @router.post("/orders", response_model=schemas.OrderOut)
 def create_order(
-    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    user_id: int = Depends(current_user_id),
     db: Session = Depends(get_db),
 ):
-    payload = _require_auth(credentials)
-    user_id = int(payload["sub"]) if isinstance(payload.get("sub"), str) else payload.get("sub")
+    return _create_order(db, user_id)
+
+
+def _create_order(db: Session, user_id: int) -> schemas.OrderOut:
     # Get the single active cart for this user (most recent one if multiple exist)
     cart = db.query(models.Panier).filter(models.Panier.id_users == user_id).order_by(models.Panier.id_panier.desc()).first()
     if not cart:
@@ -567,10 +1136,12 @@ def create_order(
     )
     if not items:
         raise HTTPException(status_code=400, detail="Cart is empty")
+    products = _products_by_id(db, [it.id_produit for it in items])
     order_items: list[schemas.OrderItemOut] = []
+    quantities: dict[int, int] = {}
     total = 0.0
     for it in items:
-        product = db.query(models.Produit).get(it.id_produit)
+        product = products.get(it.id_produit)
         if not product:
             continue
         quantity = it.quantite_stock or 0
@@ -582,122 +1153,228 @@ def create_order(
             )
         )
         total += line_total
-        if product.stock is not None:
-            product.stock = max(0, (product.stock or 0) - quantity)
-    for oi in order_items:
-        db.add(models.Commande(
-            id_users=user_id,
-            id_produit=oi.id_produit,
-            quantite=oi.quantite,
-            prix_unitaire=oi.prix,
-            statut=models.OrderStatus.pending,
-            date_commande=datetime.utcnow(),
-        ))
+        quantities[it.id_produit] = quantities.get(it.id_produit, 0) + quantity
+    try:
+        inventory.checkout(db, cart.id_panier, quantities)
+    except inventory.InsufficientStock as exc:
+        raise _insufficient_stock(db, exc)
+    if order_items:
+        now = datetime.utcnow()
+        db.execute(insert(models.Commande), [
+            dict(
+                id_users=user_id,
+                id_produit=oi.id_produit,
+                quantite=oi.quantite,
+                prix_unitaire=oi.prix,
+                statut=models.OrderStatus.pending,
+                date_commande=now,
+            )
+            for oi in order_items
+        ])
     # Clear cart items after order creation so client cart is empty
-    for it in items:
-        try:
-            db.delete(it)
-        except Exception:
-            pass
-    db.commit()
+    db.query(models.Stocker).filter(models.Stocker.id_panier == cart.id_panier).delete()
+    # Stock is part of product listings
+    catalogue.commit_stock(db, quantities)
     return schemas.OrderOut(id_users=user_id, items=order_items, prix_total=total)
 
 
+_ORDER_STATUSES = {"pending", "completed", "canceled"}
+
+
+class _OrderQuery:
+    """Filters and page of an order listing, shared by all schema variants."""
+
+    def __init__(self, statut, user_id, date_from, date_to, after, limit, descending):
+        self.statut = (statut or "").lower() or None
+        if self.statut is not None and self.statut not in _ORDER_STATUSES:
+            raise HTTPException(status_code=400, detail="Invalid status")
+        self.user_id = user_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.after = after
+        self.paged = after is not None or limit is not None
+        self.limit = limit or ADMIN_PAGE_SIZE
+        self.descending = descending
+
+    def sql_where(self, date_col: str, status_col: str | None, id_col: str | None) -> tuple[str, dict]:
+        """WHERE clause for raw SQL paths; keyset on id_col when there is one."""
+        clauses, params = [], {}
+        if self.statut is not None:
+            # Without a status column no row can match a status filter
+            clauses.append(f"LOWER({status_col}) = :statut" if status_col else "1 = 0")
+            params["statut"] = self.statut
+        if self.user_id is not None:
+            clauses.append("id_users = :user_id")
+            params["user_id"] = self.user_id
+        if self.date_from is not None:
+            clauses.append(f"{date_col} >= :date_from")
+            params["date_from"] = self.date_from
+        if self.date_to is not None:
+            clauses.append(f"{date_col} <= :date_to")
+            params["date_to"] = self.date_to
+        if id_col is not None and self.after is not None:
+            clauses.append(f"{id_col} {'<' if self.descending else '>'} :after")
+            params["after"] = self.after
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def finish(self, rows: list[schemas.OrderRowOut], response: Response) -> list[schemas.OrderRowOut]:
+        # Queries fetch limit + 1 rows to know whether another page exists
+        if self.paged and len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers["X-Next-Cursor"] = str(rows[-1].id_commande)
+        return rows
+
+
+def _order_status_out(value) -> str | None:
+    if value is None:
+        return None
+    raw = value.value if hasattr(value, "value") else str(value)
+    return raw[:1].upper() + raw[1:].lower()
+
+
+def _product_names(db: Session, ids) -> dict:
+    """Product names for the given ids in one query."""
+    from sqlalchemy import text
+    ids = list({pid for pid in ids if pid is not None})
+    if not ids:
+        return {}
+    stmt = text(f"SELECT id_produit, nom FROM {introspect.caps().product_table} WHERE id_produit IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    # Legacy tables may store id_produit as TEXT; key by string to match either way
+    return {str(pid): nom for pid, nom in db.execute(stmt, {"ids": ids})}
+
+
+def _orm_order_rows(db: Session, oq: _OrderQuery) -> list[schemas.OrderRowOut]:
+    c = models.Commande
+    query = db.query(c, models.Produit.nom).outerjoin(models.Produit, models.Produit.id_produit == c.id_produit)
+    if oq.statut is not None:
+        query = query.filter(c.statut == models.OrderStatus(oq.statut))
+    if oq.user_id is not None:
+        query = query.filter(c.id_users == oq.user_id)
+    if oq.date_from is not None:
+        query = query.filter(c.date_commande >= oq.date_from)
+    if oq.date_to is not None:
+        query = query.filter(c.date_commande <= oq.date_to)
+    if oq.after is not None:
+        query = query.filter(c.id_commande < oq.after if oq.descending else c.id_commande > oq.after)
+    query = query.order_by(c.id_commande.desc() if oq.descending else c.id_commande)
+    if oq.paged:
+        query = query.limit(oq.limit + 1)
+    return [
+        schemas.OrderRowOut(
+            id_commande=getattr(r, "id_commande", None) or 0,
+            id_users=r.id_users,
+            id_produit=r.id_produit,
+            quantite=r.quantite or 0,
+            prix_unitaire=float(getattr(r, "prix_unitaire", 0) or 0),
+            date_commande=getattr(r, "date_commande", None),
+            nom_produit=nom,
+            statut=_order_status_out(getattr(r, "statut", None)),
+        )
+        for r, nom in query
+    ]
+
+
+def _raw_order_rows(db: Session, oq: _OrderQuery) -> list[schemas.OrderRowOut]:
+    """Order rows from a non-canonical table, using the SELECT built at startup.
+
+    Tables without id_commande get synthetic ids (row positions), so `after`
+    doubles as an offset there.
+    """
+    from sqlalchemy import text
+    cap = introspect.caps()
+    where, params = oq.sql_where(cap.order_date_expr, cap.order_status_expr, cap.order_id_column)
+    sql = cap.order_select + where
+    if cap.order_id_column:
+        sql += f" ORDER BY {cap.order_id_column}{' DESC' if oq.descending else ''}"
+    if oq.paged:
+        sql += " LIMIT :limit"
+        params["limit"] = oq.limit + 1
+        if not cap.order_id_column:
+            sql += " OFFSET :offset"
+            params["offset"] = oq.after or 0
+    rows = db.execute(text(sql), params).mappings().all()
+    names = _product_names(db, [r["id_produit"] for r in rows])
+    return [
+        schemas.OrderRowOut(
+            id_commande=int(r["id_commande"]) if cap.order_id_column else (oq.after or 0) + n,
+            id_users=int(r["id_users"] or 0),
+            id_produit=r["id_produit"],
+            quantite=int(r["quantite"] or 0),
+            prix_unitaire=float(r["prix_unitaire"] or 0),
+            date_commande=r["date_commande"],
+            nom_produit=names.get(str(r["id_produit"])),
+            statut=_order_status_out(r["statut"]),
+        )
+        for n, r in enumerate(rows, start=1)
+    ]
+
+
+def _order_rows(db: Session, oq: _OrderQuery) -> list[schemas.OrderRowOut]:
+    cap = introspect.caps()
+    if cap.order_table is None:
+        return []
+    if cap.orm_orders:
+        return _orm_order_rows(db, oq)
+    return _raw_order_rows(db, oq)
+
+
 # Admin: list all order rows
 @router.get("/orders", response_model=list[schemas.OrderRowOut])
 def list_orders(
+    response: Response,
+    statut: str | None = None,
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    after: int | None = None,
+    limit: int | None = Query(None, ge=1, le=ADMIN_MAX_PAGE_SIZE),
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """Admin: list all order rows.
 
-    This endpoint is resilient to database schema differences. It first tries the
-    canonical ORM model (with columns id_commande, prix_unitaire, date_commande, statut).
-    If that fails (e.g., in an environment where the table columns are
-    id_users, id_produit, quantite, prix, prix_total, date_creation with no id_commande/statut),
-    it falls back to raw SQL and maps fields accordingly so the admin UI can still display orders.
+    Works with the canonical Commande table (ORM) and with legacy layouts
+    (id_users, id_produit, quantite, prix, prix_total, date_creation with no
+    id_commande/statut); which one is in use is detected at startup.
+
+    Rows can be filtered by status, user and date range. Pass `limit` (and
+    `after`, the previous X-Next-Cursor) to page through them by id_commande.
     """
     payload = _require_auth(credentials)
     _require_admin(payload)
+    oq = _OrderQuery(statut, user_id, date_from, date_to, after, limit, descending=False)
+    return oq.finish(_order_rows(db, oq), response)
 
-    out: list[schemas.OrderRowOut] = []
-
-    try:
-        # Preferred path: use ORM models matching the canonical schema
-        rows = db.query(models.Commande).all()
-        for r in rows:
-            prod = db.query(models.Produit).get(r.id_produit)
-            status_value = None
-            if getattr(r, "statut", None) is not None:
-                raw = r.statut.value if hasattr(r.statut, "value") else str(r.statut)
-                status_value = raw.capitalize()
-            out.append(schemas.OrderRowOut(
-                id_commande=getattr(r, "id_commande", None) or 0,
-                id_users=r.id_users,
-                id_produit=r.id_produit,
-                quantite=r.quantite or 0,
-                prix_unitaire=float(getattr(r, "prix_unitaire", 0) or 0),
-                date_commande=getattr(r, "date_commande", None),
-                nom_produit=prod.nom if prod else None,
-                statut=status_value,
-            ))
-        return out
-    except Exception:
-        # Fallback: raw SQL mapping for alternate schema
-        pass
 
-    # Fallback path: attempt to read from a schema with columns:
-    # id_users, id_produit (may be TEXT), quantite, prix (unitaire), prix_total, date_creation
+def _update_legacy_order_status(db: Session, id_commande: int, incoming: str) -> schemas.OrderRowOut:
+    """Raw SQL status update for non-canonical order tables."""
     from sqlalchemy import text
-
-    for tbl in ("Commande", "commande"):
-        try:
-            rows = db.execute(text(
-                f"""
-                SELECT 
-                  id_users, 
-                  id_produit, 
-                  quantite, 
-                  COALESCE(prix_unitaire, prix) AS prix_unitaire, 
-                  COALESCE(date_commande, date_creation) AS date_commande,
-                  statut
-                FROM {tbl}
-                """
-            )).mappings()
-            synthetic_id = 1
-            for r in rows:
-                # Try to fetch product name from Produit table regardless of id type
-                prod_name = None
-                try:
-                    prod_row = db.execute(text("SELECT nom FROM Produit WHERE id_produit = :pid"), {"pid": r["id_produit"]}).first()
-                    if not prod_row:
-                        prod_row = db.execute(text("SELECT nom FROM produit WHERE id_produit = :pid"), {"pid": r["id_produit"]}).first()
-                    if prod_row:
-                        prod_name = prod_row[0]
-                except Exception:
-                    prod_name = None
-
-                statut_val = r.get("statut")
-                statut_out = None
-                if statut_val is not None:
-                    s = str(statut_val)
-                    statut_out = s[:1].upper() + s[1:].lower()
-                out.append(schemas.OrderRowOut(
-                    id_commande=synthetic_id,
-                    id_users=r.get("id_users"),
-                    id_produit=r.get("id_produit"),
-                    quantite=r.get("quantite") or 0,
-                    prix_unitaire=float(r.get("prix_unitaire") or 0),
-                    date_commande=r.get("date_commande"),
-                    nom_produit=prod_name,
-                    statut=statut_out,
-                ))
-                synthetic_id += 1
-            return out
-        except Exception:
-            continue
-    # As a last resort, return empty list rather than failing the admin UI
-    return []
+    cap = introspect.caps()
+    if not cap.order_id_column:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if not cap.has_statut:
+        raise HTTPException(status_code=400, detail="Order status is not stored in this database")
+    updated = db.execute(
+        text(f"UPDATE {cap.order_table} SET statut = :s WHERE id_commande = :id"), {"s": incoming, "id": id_commande}
+    )
+    if not updated.rowcount:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Order not found")
+    db.commit()
+    rec = db.execute(text(cap.order_select + " WHERE id_commande = :id"), {"id": id_commande}).mappings().first()
+    names = _product_names(db, [rec["id_produit"]])
+    return schemas.OrderRowOut(
+        id_commande=id_commande,
+        id_users=rec["id_users"],
+        id_produit=rec["id_produit"],
+        quantite=rec["quantite"] or 0,
+        prix_unitaire=float(rec["prix_unitaire"] or 0),
+        date_commande=rec["date_commande"],
+        nom_produit=names.get(str(rec["id_produit"])),
+        statut=incoming.capitalize(),
+    )
 
 
 @router.put("/orders/{id_commande}/status", response_model=schemas.OrderRowOut)
@@ -709,53 +1386,30 @@ def update_order_status(
 ):
     payload = _require_auth(credentials)
     _require_admin(payload)
-    # Try ORM by primary key; if schema doesn't declare primary key, fallback to filter
-    row = db.query(models.Commande).get(id_commande)
-    if not row:
-        row = db.query(models.Commande).filter(getattr(models.Commande, "id_commande") == id_commande).first()
-    if not row:
-        # As a last resort, try raw SQL update/select for legacy schemas
-        from sqlalchemy import text
-        valid = {"pending", "completed", "canceled"}
-        incoming = (payload_in.statut or "").lower()
-        if incoming not in valid:
-            raise HTTPException(status_code=400, detail="Invalid status")
-        try:
-            db.execute(text("UPDATE Commande SET statut = :s WHERE id_commande = :id"), {"s": incoming, "id": id_commande})
-            db.commit()
-            # Fetch fields for response
-            rec = db.execute(text("SELECT id_users, id_produit, quantite, prix AS prix_unitaire, date_creation FROM Commande WHERE id_commande = :id"), {"id": id_commande}).first()
-            if not rec:
-                raise HTTPException(status_code=404, detail="Order not found")
-            # Get product name if possible
-            prod_name = None
-            try:
-                p = db.execute(text("SELECT nom FROM Produit WHERE id_produit = :pid"), {"pid": rec["id_produit"]}).first()
-                if p:
-                    prod_name = p[0]
-            except Exception:
-                prod_name = None
-            return schemas.OrderRowOut(
-                id_commande=id_commande,
-                id_users=rec["id_users"],
-                id_produit=rec["id_produit"],
-                quantite=rec["quantite"] or 0,
-                prix_unitaire=float(rec["prix_unitaire"] or 0),
-                date_commande=rec["date_creation"],
-                nom_produit=prod_name,
-                statut=incoming.capitalize(),
-            )
-        except HTTPException:
-            raise
-        except Exception:
-            raise HTTPException(status_code=500, detail="Failed to update status")
     # Validate status (case-insensitive)
-    valid = {"pending", "completed", "canceled"}
     incoming = (payload_in.statut or "").lower()
-    if incoming not in valid:
+    if incoming not in _ORDER_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
-    row.statut = models.OrderStatus(incoming)
-    db.commit()
+    if not introspect.caps().orm_orders:
+        return _update_legacy_order_status(db, id_commande, incoming)
+    row = db.query(models.Commande).get(id_commande)
+    if not row:
+        raise HTTPException(status_code=404, detail="Order not found")
+    new_status = models.OrderStatus(incoming)
+    # Cancelling returns the units to stock; reviving a cancelled order takes them again
+    moved = []
+    if row.quantite and row.statut != new_status and models.OrderStatus.canceled in (row.statut, new_status):
+        line = {row.id_produit: row.quantite}
+        try:
+            if new_status == models.OrderStatus.canceled:
+                inventory.add_stock(db, line, models.MovementType.cancellation, row.id_commande)
+            else:
+                inventory.take_stock(db, line, models.MovementType.sale, row.id_commande)
+        except inventory.InsufficientStock as exc:
+            raise _insufficient_stock(db, exc)
+        moved = [row.id_produit]
+    row.statut = new_status
+    catalogue.commit_products(db, moved)
     prod = db.query(models.Produit).get(row.id_produit)
     return schemas.OrderRowOut(
         id_commande=row.id_commande,
@@ -770,103 +1424,50 @@ def update_order_status(
 
 
 @router.get("/orders-all", response_model=list[schemas.OrderRowOut])
-def list_orders_public(db: Session = Depends(get_db)):
-    out: list[schemas.OrderRowOut] = []
-    from sqlalchemy import text
-    # Prefer explicit select from lowercase `commande` matching provided schema
-    try:
-        rows = db.execute(text(
-            """
-            SELECT id_commande,id_users,id_produit,quantite,prix_unitaire,date_commande,statut
-            FROM commande
-            ORDER BY id_commande DESC
-            """
-        )).mappings()
-        for r in rows:
-            # Fetch product name (handles both Produit/produit)
-            prod_name = None
-            try:
-                p = db.execute(text("SELECT nom FROM Produit WHERE id_produit = :pid"), {"pid": r.get("id_produit")}).first()
-                if not p:
-                    p = db.execute(text("SELECT nom FROM produit WHERE id_produit = :pid"), {"pid": r.get("id_produit")}).first()
-                if p:
-                    prod_name = p[0]
-            except Exception:
-                prod_name = None
-            statut_val = r.get("statut")
-            statut_out = None
-            if statut_val is not None:
-                s = str(statut_val)
-                statut_out = s[:1].upper() + s[1:].lower()
-            out.append(schemas.OrderRowOut(
-                id_commande=int(r.get("id_commande") or 0),
-                id_users=int(r.get("id_users") or 0),
-                id_produit=r.get("id_produit"),
-                quantite=int(r.get("quantite") or 0),
-                prix_unitaire=float(r.get("prix_unitaire") or 0),
-                date_commande=r.get("date_commande"),
-                nom_produit=prod_name,
-                statut=statut_out,
-            ))
-        return out
-    except Exception:
-        pass
-
-    # Fallback to ORM/all-caps if needed
-    try:
-        rows = db.query(models.Commande).all()
-        for r in rows:
-            prod = db.query(models.Produit).get(r.id_produit)
-            status_value = None
-            if getattr(r, "statut", None) is not None:
-                raw = r.statut.value if hasattr(r.statut, "value") else str(r.statut)
-                status_value = raw.capitalize()
-            out.append(schemas.OrderRowOut(
-                id_commande=getattr(r, "id_commande", None) or 0,
-                id_users=r.id_users,
-                id_produit=r.id_produit,
-                quantite=r.quantite or 0,
-                prix_unitaire=float(getattr(r, "prix_unitaire", 0) or 0),
-                date_commande=getattr(r, "date_commande", None),
-                nom_produit=prod.nom if prod else None,
-                statut=status_value,
-            ))
-        return out
-    except Exception:
-        return []
+def list_orders_public(
+    response: Response,
+    statut: str | None = None,
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    after: int | None = None,
+    limit: int | None = Query(None, ge=1, le=ADMIN_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Order rows, newest first; same filters and paging as GET /orders."""
+    oq = _OrderQuery(statut, user_id, date_from, date_to, after, limit, descending=True)
+    return oq.finish(_order_rows(db, oq), response)
 
 
 @router.get("/admin/carts", response_model=list[schemas.CartOut])
 def admin_list_carts(
+    response: Response,
+    user_id: int | None = None,
+    after: int | None = None,
+    limit: int | None = Query(None, ge=1, le=ADMIN_MAX_PAGE_SIZE),
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
     db: Session = Depends(get_db),
 ):
+    """All carts by id, optionally for one user.
+
+    Pass `limit` (and `after`, the X-Next-Cursor of the previous page) to page
+    through them; without either every cart is returned.
+    """
     payload = _require_auth(credentials)
     _require_admin(payload)
-    carts = db.query(models.Panier).all()
-    results: list[schemas.CartOut] = []
-    for cart in carts:
-        items = (
-            db.query(models.Stocker)
-            .filter(models.Stocker.id_panier == cart.id_panier)
-            .all()
-        )
-        results.append(
-            schemas.CartOut(
-                id_panier=cart.id_panier,
-                id_users=cart.id_users,
-                items=[
-                    schemas.CartItemOut(
-                        id_produit=i.id_produit,
-                        quantite=i.quantite_stock or 0,
-                        date_mise_a_jour=i.date_mise_a_jour,
-                    )
-                    for i in items
-                ],
-                date_creation=cart.date_creation,
-            )
-        )
-    return results
+    query = db.query(models.Panier).order_by(models.Panier.id_panier)
+    if user_id is not None:
+        query = query.filter(models.Panier.id_users == user_id)
+    if after is not None:
+        query = query.filter(models.Panier.id_panier > after)
+    if after is None and limit is None:
+        return _carts_out(db, query.all())
+    limit = limit or ADMIN_PAGE_SIZE
+    carts = query.limit(limit + 1).all()
+    if len(carts) > limit:
+        carts = carts[:limit]
+        response.headers["X-Next-Cursor"] = str(carts[-1].id_panier)
+    return _carts_out(db, carts)
 
 
 # Contact: send message to all admins (basic placeholder - logs emails)
@@ -921,16 +1522,12 @@ def users_count(db: Session = Depends(get_db)):
 
     Public endpoint to keep the admin dashboard simple even if auth header is missing.
     """
-    try:
+    cap = introspect.caps()
+    if cap.users_table is None:
+        return {"count": 0}
+    if cap.orm_users:
         total = db.query(models.Utilisateurs).count()
-        return {"count": int(total)}
-    except Exception:
-        # Fallback using raw SQL for varying table name casing
-        try:
-            from sqlalchemy import text
-            row = db.execute(text("SELECT COUNT(*) AS c FROM Utilisateurs")).mappings().first()
-            if not row:
-                row = db.execute(text("SELECT COUNT(*) AS c FROM utilisateurs")).mappings().first()
-            return {"count": int(row["c"]) if row else 0}
-        except Exception:
-            return {"count": 0}
+    else:
+        from sqlalchemy import text
+        total = db.execute(text(f"SELECT COUNT(*) FROM {cap.users_table}")).scalar()
+    return {"count": int(total or 0)}
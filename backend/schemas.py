@@ -53,6 +53,42 @@ class ProduitWithDetails(BaseModel):
         from_attributes = True
 
 
+class ProductChangesOut(BaseModel):
+    version: int
+    upserted: List[ProduitWithDetails]
+    deleted: List[int]
+
+
+class StockMovementIn(BaseModel):
+    type: str  # 'receipt' | 'adjustment'
+    quantite: int  # signed; receipts must be positive
+
+
+class StockLevelOut(BaseModel):
+    id_produit: int
+    stock: Optional[int] = None
+    at: datetime
+
+
+class FacetCount(BaseModel):
+    id: int
+    nom: Optional[str] = None
+    count: int
+
+
+class PriceBucket(BaseModel):
+    min_prix: float
+    max_prix: float
+    count: int
+
+
+class ProductFacetsOut(BaseModel):
+    total: int
+    categories: List[FacetCount]
+    brands: List[FacetCount]
+    prices: List[PriceBucket]
+
+
 # Auth schemas
 class SignupRequest(BaseModel):
     nom: str
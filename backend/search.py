@@ -0,0 +1,256 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+# Full-text search over products.
+# SQLite: an FTS5 table (one row per product, rowid = id_produit) kept in sync
+# by triggers on Produit, Marque and Categorie, ranked with BM25.
+# MySQL: the same denormalised document (name, description, brand,
+# category) in a table with one FULLTEXT index, kept in sync by triggers and
+# queried in boolean mode. Every word may match in any of the four columns,
+# as with FTS5; separate per-table indexes could not match "apple iphone"
+# when the brand holds one word and the product name the other.
+# Anything else (or if setup failed): callers fall back to LIKE filtering.
+
+FTS_TABLE = "produit_fts"
+
+# BM25 column weights: nom, description, marque, categorie
+_BM25_WEIGHTS = "10.0, 1.0, 5.0, 3.0"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Backend selected at startup by ensure_search_index: "fts5", "mysql" or None
+_backend: str | None = None
+
+
+_SQLITE_DOC = """
+    SELECT new.id_produit, new.nom, new.description,
+           (SELECT nom FROM Marque WHERE id_marque = new.id_marque),
+           (SELECT nom FROM Categorie WHERE id_categorie = new.id_categorie)
+"""
+
+_SQLITE_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        nom, description, marque, categorie,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS produit_fts_ai AFTER INSERT ON Produit BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, nom, description, marque, categorie) {_SQLITE_DOC};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS produit_fts_au
+    AFTER UPDATE OF nom, description, id_marque, id_categorie ON Produit BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id_produit;
+        INSERT INTO {FTS_TABLE}(rowid, nom, description, marque, categorie) {_SQLITE_DOC};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS produit_fts_ad AFTER DELETE ON Produit BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id_produit;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS marque_fts_au AFTER UPDATE OF nom ON Marque BEGIN
+        UPDATE {FTS_TABLE} SET marque = new.nom
+        WHERE rowid IN (SELECT id_produit FROM Produit WHERE id_marque = new.id_marque);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS categorie_fts_au AFTER UPDATE OF nom ON Categorie BEGIN
+        UPDATE {FTS_TABLE} SET categorie = new.nom
+        WHERE rowid IN (SELECT id_produit FROM Produit WHERE id_categorie = new.id_categorie);
+    END
+    """,
+]
+
+_SQLITE_REBUILD = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, nom, description, marque, categorie)
+    SELECT p.id_produit, p.nom, p.description, m.nom, c.nom
+    FROM Produit p
+    LEFT JOIN Marque m ON m.id_marque = p.id_marque
+    LEFT JOIN Categorie c ON c.id_categorie = p.id_categorie
+    """,
+]
+
+_MYSQL_COLUMNS = "nom, description, marque, categorie"
+
+_MYSQL_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {FTS_TABLE} (
+        id_produit INT PRIMARY KEY,
+        nom VARCHAR(100),
+        description VARCHAR(255),
+        marque VARCHAR(50),
+        categorie VARCHAR(50),
+        FULLTEXT INDEX ft_{FTS_TABLE} ({_MYSQL_COLUMNS})
+    ) ENGINE=InnoDB
+"""
+
+_MYSQL_DOC = """
+    SELECT NEW.id_produit, NEW.nom, NEW.description,
+           (SELECT nom FROM Marque WHERE id_marque = NEW.id_marque),
+           (SELECT nom FROM Categorie WHERE id_categorie = NEW.id_categorie)
+"""
+
+_MYSQL_TRIGGERS = {
+    "produit_fts_ai": f"""
+    CREATE TRIGGER produit_fts_ai AFTER INSERT ON Produit FOR EACH ROW
+        INSERT INTO {FTS_TABLE}(id_produit, nom, description, marque, categorie) {_MYSQL_DOC}
+    """,
+    # MySQL has no UPDATE OF: skip stock and price updates by hand
+    "produit_fts_au": f"""
+    CREATE TRIGGER produit_fts_au AFTER UPDATE ON Produit FOR EACH ROW
+    BEGIN
+        IF NOT (NEW.nom <=> OLD.nom AND NEW.description <=> OLD.description
+                AND NEW.id_marque <=> OLD.id_marque AND NEW.id_categorie <=> OLD.id_categorie) THEN
+            REPLACE INTO {FTS_TABLE}(id_produit, nom, description, marque, categorie) {_MYSQL_DOC};
+        END IF;
+    END
+    """,
+    "produit_fts_ad": f"""
+    CREATE TRIGGER produit_fts_ad AFTER DELETE ON Produit FOR EACH ROW
+        DELETE FROM {FTS_TABLE} WHERE id_produit = OLD.id_produit
+    """,
+    "marque_fts_au": f"""
+    CREATE TRIGGER marque_fts_au AFTER UPDATE ON Marque FOR EACH ROW
+        UPDATE {FTS_TABLE} SET marque = NEW.nom
+        WHERE id_produit IN (SELECT id_produit FROM Produit WHERE id_marque = NEW.id_marque)
+    """,
+    "categorie_fts_au": f"""
+    CREATE TRIGGER categorie_fts_au AFTER UPDATE ON Categorie FOR EACH ROW
+        UPDATE {FTS_TABLE} SET categorie = NEW.nom
+        WHERE id_produit IN (SELECT id_produit FROM Produit WHERE id_categorie = NEW.id_categorie)
+    """,
+}
+
+_MYSQL_REBUILD = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE}(id_produit, nom, description, marque, categorie)
+    SELECT p.id_produit, p.nom, p.description, m.nom, c.nom
+    FROM Produit p
+    LEFT JOIN Marque m ON m.id_marque = p.id_marque
+    LEFT JOIN Categorie c ON c.id_categorie = p.id_categorie
+    """,
+]
+
+# Per-table indexes from older versions, superseded by the search table
+_MYSQL_OLD_INDEXES = {
+    "Produit": "ft_produit_nom_description",
+    "Marque": "ft_marque_nom",
+    "Categorie": "ft_categorie_nom",
+}
+
+
+def ensure_search_index(engine: Engine) -> str | None:
+    """Create the full-text index for the current dialect and select the backend."""
+    global _backend
+    _backend = None
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        with engine.begin() as conn:
+            # Older databases re-indexed on every update, stock changes included
+            old_trigger = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'produit_fts_au'")
+            ).scalar()
+            if old_trigger and "UPDATE OF" not in old_trigger.upper():
+                conn.execute(text("DROP TRIGGER produit_fts_au"))
+            for stmt in _SQLITE_SETUP:
+                conn.execute(text(stmt))
+            # Backfill rows written before the triggers existed
+            indexed = conn.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar()
+            total = conn.execute(text("SELECT COUNT(*) FROM Produit")).scalar()
+            if indexed != total:
+                for stmt in _SQLITE_REBUILD:
+                    conn.execute(text(stmt))
+        _backend = "fts5"
+    elif dialect in ("mysql", "mariadb"):
+        with engine.begin() as conn:
+            conn.execute(text(_MYSQL_TABLE))
+            existing = set(conn.execute(text(
+                "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()"
+            )).scalars())
+            for name, stmt in _MYSQL_TRIGGERS.items():
+                if name not in existing:
+                    conn.execute(text(stmt))
+            for table, name in _MYSQL_OLD_INDEXES.items():
+                if conn.execute(text(f"SHOW INDEX FROM {table} WHERE Key_name = :name"), {"name": name}).first():
+                    conn.execute(text(f"ALTER TABLE {table} DROP INDEX {name}"))
+            # Backfill rows written before the triggers existed
+            indexed = conn.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar()
+            total = conn.execute(text("SELECT COUNT(*) FROM Produit")).scalar()
+            if indexed != total:
+                for stmt in _MYSQL_REBUILD:
+                    conn.execute(text(stmt))
+        _backend = "mysql"
+    return _backend
+
+
+def _tokens(q: str) -> list[str]:
+    return _TOKEN_RE.findall(q or "")
+
+
+def _fts5_query(tokens: list[str]) -> str:
+    # Quote each token so user input can't inject FTS operators; '*' = prefix match
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _mysql_query(tokens: list[str]) -> str:
+    return " ".join(f"+{t}*" for t in tokens)
+
+
+def match_clause(q: str):
+    """SQL clause restricting Produit rows to full-text matches of `q`.
+
+    Returns None when no full-text backend is active so callers can use
+    their LIKE-based fallback.
+    """
+    tokens = _tokens(q)
+    if not tokens or _backend is None:
+        return None
+    if _backend == "fts5":
+        return text(
+            f"Produit.id_produit IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_q)"
+        ).bindparams(fts_q=_fts5_query(tokens))
+    return text(
+        f"Produit.id_produit IN (SELECT id_produit FROM {FTS_TABLE}"
+        f" WHERE MATCH({_MYSQL_COLUMNS}) AGAINST (:ft_q IN BOOLEAN MODE))"
+    ).bindparams(ft_q=_mysql_query(tokens))
+
+
+def ranked_ids(db: Session, q: str, limit: int) -> list[int] | None:
+    """Return product ids matching `q`, best match first.
+
+    Returns None when no full-text backend is active.
+    """
+    tokens = _tokens(q)
+    if _backend is None:
+        return None
+    if not tokens:
+        return []
+    if _backend == "fts5":
+        rows = db.execute(text(
+            f"""
+            SELECT rowid FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH :q
+            ORDER BY bm25({FTS_TABLE}, {_BM25_WEIGHTS})
+            LIMIT :limit
+            """
+        ), {"q": _fts5_query(tokens), "limit": limit})
+    else:
+        rows = db.execute(text(
+            f"""
+            SELECT id_produit FROM {FTS_TABLE}
+            WHERE MATCH({_MYSQL_COLUMNS}) AGAINST (:q IN BOOLEAN MODE)
+            ORDER BY MATCH({_MYSQL_COLUMNS}) AGAINST (:q IN BOOLEAN MODE) DESC, id_produit
+            LIMIT :limit
+            """
+        ), {"q": _mysql_query(tokens), "limit": limit})
+    return [r[0] for r in rows]
@@ -1,4 +1,12 @@
 import os
+import math
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import jwt, JWTError
@@ -10,9 +18,37 @@ load_dotenv()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt cost. At startup calibrate_hasher() picks the number of rounds whose
+# hash takes about BCRYPT_TARGET_MS on this host (BCRYPT_ROUNDS pins it
+# instead). Hashes more than one round away from it count as outdated and are
+# re-hashed after a successful login.
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "0"))
+
 SECRET_KEY = os.getenv("SECRET_KEY", "CHANGE_ME_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# Verified tokens are remembered (by SHA-256 digest) until they expire, so a
+# client presenting the same token again skips signature verification.
+# Least recently used entries go first; 0 disables the cache.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+# bcrypt for request handlers runs in a small process pool, so a burst of
+# logins only ever uses BCRYPT_WORKERS cores and leaves the rest to other
+# endpoints. At most BCRYPT_MAX_PENDING hashes are queued or running; beyond
+# that callers get PasswordHasherBusy right away instead of piling up.
+# BCRYPT_WORKERS=0 hashes inline in the calling thread (still bounded).
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))
+# Workers run at a lower CPU priority (Unix nice increment) than the server
+BCRYPT_NICE = int(os.getenv("BCRYPT_NICE", "10"))
+
+
+class PasswordHasherBusy(RuntimeError):
+    def __init__(self):
+        super().__init__("Password hashing queue is full")
 
 
 def hash_password(password: str) -> str:
@@ -23,17 +59,160 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
 
+def check_password(plain_password: str, password_hash: str) -> tuple[bool, bool]:
+    """(valid, needs_rehash) for a stored hash.
+
+    Like CryptContext.verify_and_update, minus the new hash: computing it
+    here would double the cost of the login, so callers re-hash later.
+    Unreadable hashes (e.g. legacy plain values) are simply invalid.
+    """
+    try:
+        if not pwd_context.verify(plain_password, password_hash):
+            return False, False
+    except (ValueError, TypeError):
+        return False, False
+    return True, pwd_context.needs_update(password_hash)
+
+
+_rounds: int | None = None
+
+
+def _use_rounds(rounds: int) -> None:
+    global _rounds
+    _rounds = rounds
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=max(4, rounds - 1),
+        bcrypt__max_rounds=min(31, rounds + 1),
+    )
+
+
+def calibrate_hasher() -> int:
+    """Choose and apply the bcrypt rounds for this host; returns them.
+
+    Must run before the worker pool starts (workers get the rounds when
+    they start).
+    """
+    if BCRYPT_ROUNDS:
+        rounds = BCRYPT_ROUNDS
+    else:
+        probe = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_MIN_ROUNDS)
+        elapsed = []
+        for _ in range(2):
+            started = time.perf_counter()
+            probe.hash("calibration")
+            elapsed.append((time.perf_counter() - started) * 1000)
+        # Each extra round doubles the cost
+        rounds = BCRYPT_MIN_ROUNDS + max(0, int(math.log2(BCRYPT_TARGET_MS / max(min(elapsed), 1e-3))))
+    rounds = max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, rounds))
+    _use_rounds(rounds)
+    return rounds
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(max(1, BCRYPT_MAX_PENDING))
+
+
+def _init_worker(nice: int, rounds: int | None) -> None:
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    if rounds:
+        _use_rounds(rounds)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs server threads isn't safe
+            _pool = ProcessPoolExecutor(
+                BCRYPT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(BCRYPT_NICE, _rounds),
+            )
+        return _pool
+
+
+def _in_pool(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        if BCRYPT_WORKERS <= 0:
+            return fn(*args)
+        return _get_pool().submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool on the next call
+        global _pool
+        with _pool_lock:
+            _pool = None
+        raise
+    finally:
+        _pending.release()
+
+
+def hash_password_pooled(password: str) -> str:
+    """hash_password in the bcrypt pool; raises PasswordHasherBusy when saturated."""
+    return _in_pool(hash_password, password)
+
+
+def check_password_pooled(plain_password: str, password_hash: str) -> tuple[bool, bool]:
+    """check_password in the bcrypt pool; raises PasswordHasherBusy when saturated."""
+    return _in_pool(check_password, plain_password, password_hash)
+
+
+def _warm_up() -> None:
+    pass
+
+
+def start_hasher() -> None:
+    """Start the bcrypt workers now rather than on the first login."""
+    if BCRYPT_WORKERS > 0:
+        pool = _get_pool()
+        for future in [pool.submit(_warm_up) for _ in range(BCRYPT_WORKERS)]:
+            future.result()
+
+
+def stop_hasher() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 def create_access_token(subject: str, role: str, expires_minutes: Optional[int] = None) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes or ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"sub": subject, "role": role, "exp": expire}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+_verified: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+_verified_lock = threading.Lock()
+
+
 def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest() if TOKEN_CACHE_SIZE > 0 else None
+    if key is not None:
+        with _verified_lock:
+            hit = _verified.get(key)
+            if hit is not None:
+                if hit[1] > time.time():
+                    _verified.move_to_end(key)
+                    return dict(hit[0])
+                # Expired: verify again so it's rejected the usual way
+                del _verified[key]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError as exc:
         raise ValueError("Invalid token") from exc
+    exp = payload.get("exp")
+    if key is not None and isinstance(exp, (int, float)):
+        with _verified_lock:
+            _verified[key] = (dict(payload), float(exp))
+            while len(_verified) > TOKEN_CACHE_SIZE:
+                _verified.popitem(last=False)
+    return payload
 
 
@@ -22,6 +22,52 @@ export async function fetchProducts(): Promise<ApiProduct[]> {
   return res.json();
 }
 
+export type ProductSort = 'id' | 'price-asc' | 'price-desc' | 'newest' | 'popularity';
+
+export type ProductQuery = {
+  q?: string;
+  id_categorie?: number;
+  id_marque?: number;
+  min_prix?: number;
+  max_prix?: number;
+  since?: string;
+  sort?: ProductSort;
+};
+
+export type ProductPage = { items: ApiProduct[]; nextCursor: string | null };
+
+// Fetch one page of products filtered and sorted server-side.
+// Pass the returned nextCursor back as `after` to load the following page.
+export async function fetchProductsPage(query: ProductQuery = {}, after?: string | null, limit = 50): Promise<ProductPage> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== '') params.set(key, String(value));
+  });
+  if (after) params.set('after', after);
+  const res = await fetch(`${API_URL}/products?${params.toString()}`);
+  if (!res.ok) throw new Error('Failed to load products');
+  return { items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
+export type FacetCount = { id: number; nom?: string; count: number };
+export type ProductFacets = {
+  total: number;
+  categories: FacetCount[];
+  brands: FacetCount[];
+  prices: { min_prix: number; max_prix: number; count: number }[];
+};
+
+// Counts per category, brand and price band for a filter set (sort is ignored)
+export async function fetchProductFacets(query: ProductQuery = {}, bucketSize = 100): Promise<ProductFacets> {
+  const params = new URLSearchParams({ bucket_size: String(bucketSize) });
+  Object.entries(query).forEach(([key, value]) => {
+    if (key !== 'sort' && value !== undefined && value !== '') params.set(key, String(value));
+  });
+  const res = await fetch(`${API_URL}/products/facets?${params.toString()}`);
+  if (!res.ok) throw new Error('Failed to load product facets');
+  return res.json();
+}
+
 export async function fetchCategories(): Promise<ApiCategory[]> {
   const res = await fetch(`${API_URL}/categories`);
   if (!res.ok) throw new Error('Failed to load categories');
@@ -3,10 +3,12 @@ import { motion } from 'framer-motion';
 import { Search, Filter, Grid, List, Sparkles, TrendingUp, Loader2 } from 'lucide-react';
 import ProductCard from '../components/ProductCard';
 import Notification from '../components/Notification';
-import { fetchProducts, fetchCategories, fetchBrands, ApiProduct, ApiCategory, ApiBrand } from '../lib/api';
+import { fetchProductsPage, fetchCategories, fetchBrands, ApiProduct, ApiCategory, ApiBrand, ProductQuery } from '../lib/api';
 import { Product } from '../types';
 
-// pagination disabled; showing full filtered list
+// Filtering, sorting and paging happen server-side; pages are appended on "load more"
+const PAGE_SIZE = 48;
+const NEW_PRODUCT_DAYS = 30;
 
 const Catalogue: React.FC = () => {
   const [searchQuery, setSearchQuery] = useState('');
@@ -17,10 +19,14 @@ const Catalogue: React.FC = () => {
   const [sortBy, setSortBy] = useState<'price-asc' | 'price-desc' | 'newest' | 'popularity'>('popularity');
   const [viewMode, setViewMode] = useState<'grid' | 'list'>('grid');
   const [organizationMode, setOrganizationMode] = useState<'normal' | 'category'>('normal');
-  const [currentPage, setCurrentPage] = useState(1);
   const [showFilters, setShowFilters] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [products, setProducts] = useState<ApiProduct[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [maxPrice, setMaxPrice] = useState(50000);
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [referenceLoaded, setReferenceLoaded] = useState(false);
   const [categories, setCategories] = useState<ApiCategory[]>([]);
   const [brands, setBrands] = useState<ApiBrand[]>([]);
   const [notification, setNotification] = useState<{
@@ -33,17 +39,7 @@ const Catalogue: React.FC = () => {
     isVisible: false,
   });
 
-  // Compute dynamic max price from loaded products
-  const maxPrice = useMemo(() => {
-    if (!products || products.length === 0) return 50000;
-    const nums = products
-      .map(p => Number(p.prix))
-      .filter(n => Number.isFinite(n));
-    const max = nums.length ? Math.max(...nums) : 50000;
-    return Math.max(100, Math.ceil(max));
-  }, [products]);
-
-  // Ensure price range upper bound tracks the data's max price when products load
+  // Ensure price range upper bound tracks the catalogue's max price
   useEffect(() => {
     setPriceRange(prev => {
       const lower = Math.max(0, Math.min(prev[0], maxPrice));
@@ -52,71 +48,96 @@ const Catalogue: React.FC = () => {
     });
   }, [maxPrice]);
 
-  // Load data from API
+  // Load reference data and the catalogue's highest price once
   useEffect(() => {
     const loadData = async () => {
-      setIsLoading(true);
       try {
-        const [productsData, categoriesData, brandsData] = await Promise.all([
-          fetchProducts(),
+        const [categoriesData, brandsData, priciest] = await Promise.all([
           fetchCategories(),
-          fetchBrands()
+          fetchBrands(),
+          fetchProductsPage({ sort: 'price-desc' }, null, 1)
         ]);
-        setProducts(productsData);
         setCategories(categoriesData);
         setBrands(brandsData);
+        const top = Number(priciest.items[0]?.prix);
+        if (Number.isFinite(top)) setMaxPrice(Math.max(100, Math.ceil(top)));
       } catch (error) {
         console.error('Error loading data:', error);
         showNotification('Erreur lors du chargement des données', 'error');
       } finally {
-        setIsLoading(false);
+        setReferenceLoaded(true);
       }
     };
     loadData();
   }, []);
 
-  const filteredProducts = useMemo(() => {
-    let filtered = products.filter(product => {
-      const catName = product.categorie?.nom || '';
-      const brandName = product.marque?.nom || '';
-      const name = product.nom || '';
-      const priceNum = Number(product.prix);
-      const hasValidPrice = Number.isFinite(priceNum);
-      const matchesSearch = name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-                           brandName.toLowerCase().includes(searchQuery.toLowerCase()) ||
-                           catName.toLowerCase().includes(searchQuery.toLowerCase());
-      const matchesCategory = !selectedCategory || catName === selectedCategory;
-      const matchesBrand = !selectedBrand || brandName === selectedBrand;
-      // If price is missing/invalid, don't exclude the product from the list
-      const matchesPrice = hasValidPrice ? (priceNum >= priceRange[0] && priceNum <= priceRange[1]) : true;
-      const matchesNew = !showNew;
-      return matchesSearch && matchesCategory && matchesBrand && matchesPrice && matchesNew;
-    });
-
-    // Sort products
-    switch (sortBy) {
-      case 'price-asc':
-        filtered.sort((a, b) => a.prix - b.prix);
-        break;
-      case 'price-desc':
-        filtered.sort((a, b) => b.prix - a.prix);
-        break;
-      case 'newest':
-        // Sort by id_produit (assumed numeric) newest first
-        filtered.sort((a, b) => (b.id_produit as unknown as number) - (a.id_produit as unknown as number));
-        break;
-      case 'popularity':
-        filtered.sort((a, b) => b.stock - a.stock);
-        break;
+  // Debounce the search box so typing doesn't fire a request per keystroke
+  useEffect(() => {
+    const handle = setTimeout(() => setDebouncedSearch(searchQuery.trim()), 300);
+    return () => clearTimeout(handle);
+  }, [searchQuery]);
+
+  const productQuery = useMemo<ProductQuery>(() => {
+    const query: ProductQuery = { sort: sortBy };
+    if (debouncedSearch) query.q = debouncedSearch;
+    const category = categories.find(c => c.nom === selectedCategory);
+    if (category) query.id_categorie = category.id_categorie;
+    const brand = brands.find(b => b.nom === selectedBrand);
+    if (brand) query.id_marque = brand.id_marque;
+    // Only send price bounds when narrowed, so the full range stays unfiltered
+    if (priceRange[0] > 0) query.min_prix = priceRange[0];
+    if (priceRange[1] < maxPrice) query.max_prix = priceRange[1];
+    if (showNew) {
+      const since = new Date(Date.now() - NEW_PRODUCT_DAYS * 24 * 60 * 60 * 1000);
+      query.since = since.toISOString().slice(0, 19);
     }
+    return query;
+  }, [debouncedSearch, selectedCategory, selectedBrand, priceRange, maxPrice, showNew, sortBy, categories, brands]);
 
-    return filtered;
-  }, [searchQuery, selectedCategory, selectedBrand, priceRange, showNew, sortBy, products, categories, brands]);
+  // Reload the first page whenever the filter set changes
+  useEffect(() => {
+    // Wait for categories/brands/max price so the first request isn't thrown away
+    if (!referenceLoaded) return;
+    let cancelled = false;
+    const loadFirstPage = async () => {
+      setIsLoading(true);
+      try {
+        const page = await fetchProductsPage(productQuery, null, PAGE_SIZE);
+        if (cancelled) return;
+        setProducts(page.items);
+        setNextCursor(page.nextCursor);
+      } catch (error) {
+        if (cancelled) return;
+        console.error('Error loading products:', error);
+        showNotification('Erreur lors du chargement des données', 'error');
+      } finally {
+        if (!cancelled) setIsLoading(false);
+      }
+    };
+    loadFirstPage();
+    return () => {
+      cancelled = true;
+    };
+  }, [productQuery, referenceLoaded]);
+
+  const loadMore = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const page = await fetchProductsPage(productQuery, nextCursor, PAGE_SIZE);
+      setProducts(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error loading products:', error);
+      showNotification('Erreur lors du chargement des données', 'error');
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
-  const paginatedProducts = useMemo(() => {
-    // Show all filtered products (no pagination slicing)
-    return filteredProducts;
-  }, [filteredProducts]);
+  // Products arrive already filtered and sorted by the API
+  const filteredProducts = products;
+  const paginatedProducts = products;
 
   // Organize products by category for better visual organization
   const organizedProductsByCategory = useMemo(() => {
@@ -132,12 +153,6 @@ const Catalogue: React.FC = () => {
     return organized;
   }, [filteredProducts]);
 
-  const totalPages = 1; // pagination disabled when showing all
-
-  useEffect(() => {
-    setCurrentPage(1);
-  }, [searchQuery, selectedCategory, selectedBrand, priceRange, showNew, sortBy]);
-
   const clearFilters = () => {
     setSearchQuery('');
     setSelectedCategory('');
@@ -529,26 +544,21 @@ const Catalogue: React.FC = () => {
                   </div>
                 )}
 
-                {/* Pagination */}
-                {totalPages > 1 && (
+                {/* Load more */}
+                {nextCursor && (
                   <motion.div
                     initial={{ opacity: 0 }}
                     animate={{ opacity: 1 }}
-                    className="flex items-center justify-center mt-12 space-x-2"
+                    className="flex items-center justify-center mt-12"
                   >
-                    {[...Array(totalPages)].map((_, index) => (
-                      <button
-                        key={index}
-                        onClick={() => setCurrentPage(index + 1)}
-                        className={`px-4 py-2 rounded-xl font-medium transition-all duration-300 ${
-                          currentPage === index + 1
-                            ? 'bg-gradient-to-r from-primary to-secondary text-white shadow-lg'
-                            : 'bg-white/80 backdrop-blur-sm text-gray-600 hover:bg-white border border-white/20 hover:shadow-lg'
-                        }`}
-                      >
-                        {index + 1}
-                      </button>
-                    ))}
+                    <button
+                      onClick={loadMore}
+                      disabled={isLoadingMore}
+                      className="flex items-center px-8 py-3 rounded-xl font-medium bg-gradient-to-r from-primary to-secondary text-white hover:from-secondary hover:to-primary transition-all duration-300 shadow-lg disabled:opacity-60"
+                    >
+                      {isLoadingMore && <Loader2 className="w-4 h-4 mr-2 animate-spin" />}
+                      Afficher plus de produits
+                    </button>
                   </motion.div>
                 )}
               </>
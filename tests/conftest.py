@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+
+# Configure the backend before it is imported: a scratch SQLite database,
+# inline cheap bcrypt, no background work, no login rate limits.
+_db_dir = tempfile.mkdtemp(prefix="catalogue-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("BCRYPT_WORKERS", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("BCRYPT_MIN_ROUNDS", "4")
+os.environ.setdefault("RESERVATION_SWEEP_INTERVAL", "3600")
+os.environ.setdefault("CATALOGUE_STOCK_FLUSH_INTERVAL", "3600")
+os.environ.setdefault("AUTH_RATE_LIMIT", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend.main import app
+from backend.database import SessionLocal, engine
+from backend import models, security, catalogue, inventory, ratelimit, routers
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def clean_db(client):
+    """Empty every table and per-process cache before each test."""
+    with engine.begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    db = SessionLocal()
+    try:
+        catalogue.ensure_version(db)
+    finally:
+        db.close()
+    catalogue._versions.clear()
+    catalogue._stock_pending.clear()
+    routers._profiles.clear()
+    security._verified.clear()
+    ratelimit._store = None
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def make_products(db, n: int, stock: int | None = 5) -> list[int]:
+    cat, brand = models.Categorie(nom="cat"), models.Marque(nom="brand")
+    db.add_all([cat, brand])
+    db.flush()
+    products = [
+        models.Produit(
+            nom=f"produit {i}", description=f"desc {i}", prix=10 + i, stock=stock,
+            id_categorie=cat.id_categorie, id_marque=brand.id_marque,
+        )
+        for i in range(n)
+    ]
+    db.add_all(products)
+    db.commit()
+    inventory.open_ledger(db)
+    return [p.id_produit for p in products]
+
+
+def make_user(db, email: str, role: models.UserRole = models.UserRole.client) -> dict:
+    user = models.Utilisateurs(nom=email.split("@")[0], email=email, mdp_hash=security.hash_password("pw"), role=role)
+    db.add(user)
+    db.commit()
+    token = security.create_access_token(str(user.id_users), role.value)
+    return {"Authorization": f"Bearer {token}"}
+
+
+class QueryCounter:
+    """Counts statements sent to the database while active."""
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+        self.statements: list[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "before_cursor_execute", self._record)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
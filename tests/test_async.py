@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+from starlette.requests import Request
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import catalogue, database, routers
+from conftest import make_products
+
+
+def _request(headers: dict | None = None) -> Request:
+    raw = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/products", "headers": raw, "query_string": b""})
+
+
+def test_async_listing_reads_the_version_on_its_own_connection(db, monkeypatch):
+    make_products(db, 3)
+
+    def no_sync_session():
+        raise AssertionError("sync session opened on the event loop")
+
+    monkeypatch.setattr(catalogue, "SessionLocal", no_sync_session)
+    engine = database._make_async_engine(database._async_url(database.DATABASE_URL))
+
+    async def listing():
+        async with AsyncSession(engine) as session:
+            response = Response()
+            rows = await session.run_sync(
+                routers._list_products, _request(), response, None, None, None, None, None, None, None, None, "id"
+            )
+            return rows, response
+
+    try:
+        rows, response = asyncio.run(listing())
+    finally:
+        asyncio.run(engine.dispose())
+    assert len(rows) == 3
+    assert response.headers["ETag"] == f'"catalogue-{catalogue.read_version(db)}"'
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from backend import models
+from conftest import QueryCounter, make_products, make_user
+
+
+def _carts(db, id_users: int, n: int, id_produit: int) -> None:
+    """n carts for the user, two lines each."""
+    for _ in range(n):
+        cart = models.Panier(id_users=id_users, date_creation=datetime.utcnow())
+        db.add(cart)
+        db.flush()
+        db.add_all([
+            models.Stocker(id_panier=cart.id_panier, id_produit=id_produit, quantite_stock=1),
+            models.Stocker(id_panier=cart.id_panier, id_produit=id_produit + 1, quantite_stock=2),
+        ])
+    db.commit()
+
+
+def _queries(client, path: str, headers: dict, carts: int) -> int:
+    client.get(path, headers=headers)  # warm auth and profile caches
+    with QueryCounter() as counter:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body) == carts and all(len(c["items"]) == 2 for c in body)
+    return counter.count
+
+
+def test_cart_listings_query_count_is_constant(client, db):
+    pid = make_products(db, 2)[0]
+    user = make_user(db, "user@example.com")
+    admin = make_user(db, "admin@example.com", models.UserRole.admin)
+    id_users = db.query(models.Utilisateurs.id_users).filter(models.Utilisateurs.email == "user@example.com").scalar()
+
+    _carts(db, id_users, 2, pid)
+    few = _queries(client, "/carts", user, 2), _queries(client, "/admin/carts", admin, 2)
+    _carts(db, id_users, 20, pid)
+    many = _queries(client, "/carts", user, 22), _queries(client, "/admin/carts", admin, 22)
+    assert few == many
+    paged = client.get("/admin/carts", params={"user_id": id_users, "limit": 5}, headers=admin)
+    assert len(paged.json()) == 5 and "X-Next-Cursor" in paged.headers
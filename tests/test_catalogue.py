@@ -0,0 +1,49 @@
+from backend import models, catalogue
+from conftest import make_products, make_user
+
+
+def test_cart_traffic_does_not_bump_catalogue_version(client, db):
+    pid = make_products(db, 3, stock=10)[0]
+    user = make_user(db, "user@example.com")
+    first = client.get("/products")
+    etag = first.headers["ETag"]
+    changes = db.query(models.ProduitChange).count()
+
+    for _ in range(3):
+        assert client.post("/cart/add", json={"id_produit": pid, "quantite": 1}, headers=user).status_code == 200
+    assert client.post("/cart/clear", headers=user).status_code == 200
+    assert client.post("/cart/add", json={"id_produit": pid, "quantite": 2}, headers=user).status_code == 200
+
+    assert client.get("/products", headers={"If-None-Match": etag}).status_code == 304
+    assert db.query(models.ProduitChange).count() == changes
+
+    # One coalesced bump for everything queued
+    assert catalogue.flush_stock(db) == 1
+    assert db.query(models.ProduitChange).count() == changes + 1
+    fresh = client.get("/products", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["ETag"] != etag
+    assert {p["id_produit"]: p["stock"] for p in fresh.json()}[pid] == 8
+    assert catalogue.flush_stock(db) == 0
+
+
+def test_etag_version_comes_from_the_database_serving_the_body(db, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    # A "replica" that lags: it is still at version 3 while the primary moves on
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    models.Base.metadata.create_all(bind=replica_engine)
+    replica = sessionmaker(bind=replica_engine)()
+    try:
+        replica.add(models.CatalogueVersion(id=1, version=3))
+        replica.commit()
+
+        catalogue.set_version(catalogue.bump_version(db))
+        db.commit()
+        primary_version = catalogue.current_version(db)
+        assert primary_version == catalogue.read_version(db)
+        assert catalogue.cache_headers(replica)["ETag"] == '"catalogue-3"'
+        assert catalogue.cache_headers(db)["ETag"] == f'"catalogue-{primary_version}"'
+    finally:
+        replica.close()
+        replica_engine.dispose()
@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import func
+
+from backend import models, routers
+from backend.database import SessionLocal
+from conftest import QueryCounter, make_products, make_user
+
+BUYERS = 100
+STOCK = 10
+
+
+def _buyers_with_carts(db, id_produit: int, n: int) -> list[int]:
+    """n users, each with a one-unit cart line for the product and no hold."""
+    users = [models.Utilisateurs(nom=f"b{i}", email=f"b{i}@example.com", mdp_hash="x") for i in range(n)]
+    db.add_all(users)
+    db.flush()
+    carts = [models.Panier(id_users=u.id_users, date_creation=datetime.utcnow()) for u in users]
+    db.add_all(carts)
+    db.flush()
+    db.add_all([models.Stocker(id_panier=c.id_panier, id_produit=id_produit, quantite_stock=1) for c in carts])
+    db.commit()
+    return [u.id_users for u in users]
+
+
+def test_parallel_checkouts_never_oversell(db):
+    pid = make_products(db, 1, stock=STOCK)[0]
+    users = _buyers_with_carts(db, pid, BUYERS)
+    start = threading.Barrier(BUYERS)
+
+    def buy(user_id: int) -> int:
+        session = SessionLocal()
+        try:
+            start.wait()
+            routers._create_order(session, user_id)
+            session.commit()
+            return 200
+        except HTTPException as exc:
+            session.rollback()
+            return exc.status_code
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=BUYERS) as pool:
+        results = list(pool.map(buy, users))
+
+    assert results.count(200) == STOCK
+    assert results.count(409) == BUYERS - STOCK
+    db.expire_all()
+    stock = db.query(models.Produit.stock).filter(models.Produit.id_produit == pid).scalar()
+    ledger = db.query(func.sum(models.MouvementStock.quantite)).filter(
+        models.MouvementStock.id_produit == pid
+    ).scalar()
+    sold = db.query(func.sum(models.Commande.quantite)).filter(models.Commande.id_produit == pid).scalar()
+    assert stock == 0
+    assert ledger == stock
+    assert sold == STOCK
+
+
+def _checkout_statements(client, db, lines: int, per_cart: bool) -> int:
+    """Statements run by one checkout of a cart with `lines` held products."""
+    user = make_user(db, f"u{lines}{per_cart}@example.com")
+    ids = make_products(db, lines)
+    if per_cart:
+        cart_id = client.post("/cart/new", headers=user).json()["cart_id"]
+        add, order = f"/cart/{cart_id}/add", f"/cart/{cart_id}/order"
+    else:
+        add, order = "/cart/add", "/orders"
+    for pid in ids:
+        assert client.post(add, json={"id_produit": pid, "quantite": 1}, headers=user).status_code == 200
+    client.get("/carts", headers=user)  # warm auth and profile caches
+    with QueryCounter() as counter:
+        response = client.post(order, headers=user)
+    assert response.status_code == 200
+    assert db.query(models.Commande).count() == lines
+    assert db.query(models.Reservation).count() == 0
+    return counter.count
+
+
+def test_checkout_statement_count_does_not_grow_with_the_cart(client, db):
+    for per_cart in (False, True):
+        small = _checkout_statements(client, db, 5, per_cart)
+        db.query(models.Commande).delete()
+        db.commit()
+        assert _checkout_statements(client, db, 50, per_cart) == small
+        db.query(models.Commande).delete()
+        db.commit()
@@ -0,0 +1,77 @@
+import pytest
+
+from backend import models, catalogue
+
+
+def _catalogue(db) -> dict[str, int]:
+    """Two categories and brands; ids by name."""
+    a, b = models.Categorie(nom="A"), models.Categorie(nom="B")
+    x, y = models.Marque(nom="X"), models.Marque(nom="Y")
+    db.add_all([a, b, x, y])
+    db.flush()
+    for cat, brand, prix in ((a, x, 50), (a, y, 150), (b, x, 250), (b, x, 60), (a, x, 120)):
+        db.add(models.Produit(nom=f"{cat.nom}{brand.nom}{prix}", prix=prix, stock=1,
+                              id_categorie=cat.id_categorie, id_marque=brand.id_marque))
+    db.commit()
+    return {"A": a.id_categorie, "B": b.id_categorie, "X": x.id_marque, "Y": y.id_marque}
+
+
+@pytest.fixture(params=["database", "snapshot"])
+def read_model(request, db, monkeypatch):
+    monkeypatch.setattr(catalogue, "_snapshot", None)
+    ids = _catalogue(db)
+    if request.param == "snapshot":
+        catalogue.load(db)
+    return ids
+
+
+def _facets(client, **params) -> dict:
+    response = client.get("/products/facets", params=params)
+    assert response.status_code == 200
+    body = response.json()
+    return {
+        "total": body["total"],
+        "categories": {c["nom"]: c["count"] for c in body["categories"]},
+        "brands": {b["nom"]: b["count"] for b in body["brands"]},
+        "prices": {p["min_prix"]: p["count"] for p in body["prices"]},
+    }
+
+
+def test_each_facet_ignores_its_own_filter(client, read_model):
+    ids = read_model
+    facets = _facets(client, id_categorie=ids["A"], id_marque=ids["X"], min_prix=100, bucket_size=100)
+    # Matches: A/X/120 only
+    assert facets["total"] == 1
+    # Categories keep brand X and the price range, not category A
+    assert facets["categories"] == {"A": 1, "B": 1}
+    # Brands keep category A and the price range, not brand X
+    assert facets["brands"] == {"X": 1, "Y": 1}
+    # Price bands keep category A and brand X, not the price range
+    assert facets["prices"] == {0: 1, 100: 1}
+
+
+def test_facets_without_filters_count_everything(client, read_model):
+    facets = _facets(client, bucket_size=100)
+    assert facets == {
+        "total": 5,
+        "categories": {"A": 3, "B": 2},
+        "brands": {"X": 4, "Y": 1},
+        "prices": {0: 2, 100: 2, 200: 1},
+    }
+
+
+def test_snapshot_facet_counts_follow_writes(db, monkeypatch):
+    monkeypatch.setattr(catalogue, "_snapshot", None)
+    ids = _catalogue(db)
+    catalogue.load(db)
+    moved = db.query(models.Produit).filter(models.Produit.prix == 250).one()
+    moved.prix, moved.id_marque = 55, ids["Y"]
+    db.add(models.Produit(nom="new", prix=10, stock=1, id_categorie=ids["A"], id_marque=ids["X"]))
+    db.commit()
+    new_id = db.query(models.Produit.id_produit).filter(models.Produit.nom == "new").scalar()
+    catalogue.products_saved(db, [moved.id_produit, new_id])
+    catalogue.product_deleted(db.query(models.Produit.id_produit).filter(models.Produit.prix == 150).scalar())
+
+    snap = catalogue.current()
+    assert snap.facet_counts == catalogue._count_facets(snap.product_facets)
+    assert sum(snap.facet_counts.values()) == 5
@@ -0,0 +1,174 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+
+from backend import models, inventory
+from backend.database import SessionLocal
+from conftest import make_products
+
+
+def _cart_with_hold(db, id_produit: int, quantite: int, expired: bool = False) -> int:
+    user = models.Utilisateurs(nom="u", email="u@example.com", mdp_hash="x")
+    db.add(user)
+    db.flush()
+    cart = models.Panier(id_users=user.id_users, date_creation=datetime.utcnow())
+    db.add(cart)
+    db.flush()
+    inventory.hold(db, cart.id_panier, id_produit, quantite)
+    db.commit()
+    if expired:
+        db.query(models.Reservation).update({"date_expiration": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    return cart.id_panier
+
+
+def _stock(db, id_produit: int) -> tuple[int, int]:
+    """(Produit.stock, ledger total) as committed."""
+    db.expire_all()
+    stock = db.query(models.Produit.stock).filter(models.Produit.id_produit == id_produit).scalar()
+    ledger = db.query(func.sum(models.MouvementStock.quantite)).filter(
+        models.MouvementStock.id_produit == id_produit
+    ).scalar()
+    return stock, int(ledger or 0)
+
+
+def _checkout_before_delete(session, id_panier: int, quantities: dict[int, int]) -> None:
+    """Commit a checkout of the cart just before `session` deletes holds.
+
+    Reproduces the interleaving where both sides selected the same holds.
+    """
+    state = {"armed": True}
+
+    @event.listens_for(session, "do_orm_execute")
+    def interleave(orm_execute_state):
+        if state["armed"] and orm_execute_state.is_delete:
+            state["armed"] = False
+            other = SessionLocal()
+            try:
+                inventory.checkout(other, id_panier, quantities)
+                other.commit()
+            finally:
+                other.close()
+
+
+def test_sweeper_does_not_release_a_hold_checkout_consumed(db):
+    pid = make_products(db, 1, stock=10)[0]
+    cart = _cart_with_hold(db, pid, 5, expired=True)
+    sweeper = SessionLocal()
+    _checkout_before_delete(sweeper, cart, {pid: 5})
+    try:
+        released = inventory.sweep_expired(sweeper)
+    finally:
+        sweeper.close()
+
+    assert released == 0
+    assert _stock(db, pid) == (5, 5)
+    assert db.query(models.Reservation).count() == 0
+
+
+def test_clear_cart_does_not_release_a_hold_checkout_consumed(db):
+    pid = make_products(db, 1, stock=10)[0]
+    cart = _cart_with_hold(db, pid, 5)
+    clearing = SessionLocal()
+    _checkout_before_delete(clearing, cart, {pid: 5})
+    try:
+        released = inventory.release_holds(clearing, cart)
+        clearing.commit()
+    finally:
+        clearing.close()
+
+    assert released == {}
+    assert _stock(db, pid) == (5, 5)
+
+
+def test_sweeper_releases_expired_holds(db):
+    pid = make_products(db, 1, stock=10)[0]
+    _cart_with_hold(db, pid, 4, expired=True)
+    assert _stock(db, pid) == (6, 6)
+
+    assert inventory.sweep_expired(db) == 1
+    assert _stock(db, pid) == (10, 10)
+    assert db.query(models.Reservation).count() == 0
+
+
+def _backdate_movements(db, seconds: float) -> None:
+    db.query(models.MouvementStock).update(
+        {"date_mouvement": datetime.utcnow() - timedelta(seconds=seconds)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_snapshot_skips_movements_that_may_still_commit(db):
+    pid = make_products(db, 1, stock=10)[0]
+    inventory.take_stock(db, {pid: 1})
+    db.commit()
+    _backdate_movements(db, inventory.STOCK_SNAPSHOT_GRACE + 60)
+    # A movement whose id was allocated first but whose transaction is
+    # still open: simulated by leaving an id gap and filling it later
+    first_ids = [m.id_mouvement for m in db.query(models.MouvementStock)]
+    gap = max(first_ids) + 1
+    db.add(models.MouvementStock(
+        id_mouvement=gap + 1, id_produit=pid, type=models.MovementType.sale,
+        quantite=-2, date_mouvement=datetime.utcnow(),
+    ))
+    db.commit()
+
+    assert inventory.snapshot_stock(db) == 1
+    snapshot = db.query(models.SnapshotStock).one()
+    assert (snapshot.id_mouvement, snapshot.stock) == (max(first_ids), 9)
+
+    # The in-flight movement commits now, below the newest id
+    db.add(models.MouvementStock(
+        id_mouvement=gap, id_produit=pid, type=models.MovementType.sale,
+        quantite=-3, date_mouvement=datetime.utcnow(),
+    ))
+    db.commit()
+    _backdate_movements(db, inventory.STOCK_SNAPSHOT_GRACE + 30)
+
+    assert inventory.snapshot_stock(db) == 1
+    assert inventory.stock_at(db, pid, datetime.utcnow()) == 4
+    latest = db.query(models.SnapshotStock).order_by(models.SnapshotStock.id_snapshot.desc()).first()
+    assert (latest.id_mouvement, latest.stock) == (gap + 1, 4)
+
+
+def test_set_stock_keeps_a_hold_committed_during_the_adjustment(db):
+    pid = make_products(db, 1, stock=3)[0]
+    user = models.Utilisateurs(nom="u", email="u@example.com", mdp_hash="x")
+    db.add(user)
+    db.flush()
+    cart = models.Panier(id_users=user.id_users, date_creation=datetime.utcnow())
+    db.add(cart)
+    db.commit()
+
+    def hold_two():
+        other = SessionLocal()
+        try:
+            inventory.hold(other, cart.id_panier, pid, 2)
+            other.commit()
+        finally:
+            other.close()
+
+    admin = SessionLocal()
+    holder = threading.Thread(target=hold_two)
+    state = {"armed": True}
+
+    @event.listens_for(admin, "do_orm_execute")
+    def interleave(orm_execute_state):
+        # A buyer's hold commits right after the current stock is read,
+        # unless the row is locked and it has to wait for the adjustment
+        if state["armed"] and orm_execute_state.is_select:
+            state["armed"] = False
+            result = orm_execute_state.invoke_statement()
+            holder.start()
+            holder.join(timeout=0.5)
+            return result
+
+    try:
+        inventory.set_stock(admin, pid, 10)
+        admin.commit()
+    finally:
+        admin.close()
+    holder.join()
+
+    assert _stock(db, pid) == (8, 8)
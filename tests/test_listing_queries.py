@@ -0,0 +1,37 @@
+from backend import models
+from conftest import QueryCounter
+
+
+def _products(db, n: int) -> None:
+    """n products, each with its own category and brand."""
+    for i in range(n):
+        cat, brand = models.Categorie(nom=f"cat {i}"), models.Marque(nom=f"brand {i}")
+        db.add_all([cat, brand])
+        db.flush()
+        db.add(models.Produit(
+            nom=f"produit {i}", prix=10 + i, stock=5,
+            id_categorie=cat.id_categorie, id_marque=brand.id_marque,
+        ))
+    db.commit()
+
+
+def _listing_queries(client, db, n: int, params: dict) -> int:
+    db.query(models.Produit).delete()
+    db.query(models.Categorie).delete()
+    db.query(models.Marque).delete()
+    db.commit()
+    _products(db, n)
+    client.get("/products", params=params)  # warm the catalogue version memo
+    with QueryCounter() as counter:
+        response = client.get("/products", params=params)
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body) == min(n, params.get("limit", n))
+    assert all(p["categorie"]["nom"] and p["marque"]["nom"] for p in body)
+    return counter.count
+
+
+def test_product_listing_query_count_is_constant(client, db):
+    # Sorting by price skips the in-memory read model and hits the database
+    for params in ({"sort": "price-asc"}, {"sort": "price-asc", "limit": 50}):
+        assert _listing_queries(client, db, 3, params) == _listing_queries(client, db, 30, params)
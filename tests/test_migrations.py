@@ -0,0 +1,31 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, text
+
+from backend import migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MIGRATE = "from backend import migrations; from backend.database import engine; migrations.run(engine)"
+
+
+def test_workers_starting_together_on_legacy_db(tmp_path):
+    """Two workers migrating the shipped legacy database at once both start cleanly."""
+    db = tmp_path / "legacy.db"
+    shutil.copy(os.path.join(ROOT, "catalogue.db"), db)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db}")
+    workers = [
+        subprocess.Popen([sys.executable, "-c", _MIGRATE], cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    for worker in workers:
+        _, err = worker.communicate(timeout=120)
+        assert worker.returncode == 0, err
+
+    engine = create_engine(f"sqlite:///{db}")
+    with engine.connect() as conn:
+        versions = [row[0] for row in conn.execute(text("SELECT version FROM schema_version ORDER BY version"))]
+    engine.dispose()
+    assert versions == [version for version, _, _ in migrations.MIGRATIONS]
@@ -0,0 +1,54 @@
+from sqlalchemy import event
+
+from backend import models
+from backend.database import engine
+from conftest import make_products, make_user
+
+# Tables on the cart/checkout/order hot paths; every statement touching them
+# must be answered from an index (or the primary key), never a full scan.
+HOT_TABLES = ("PANIER", "STOCKER", "COMMANDE", "RESERVATION")
+
+
+def _full_scans(plan: list[str]) -> list[str]:
+    return [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+
+
+def test_hot_endpoints_use_indexes(client, db):
+    pids = make_products(db, 5)
+    admin = make_user(db, "admin@example.com", models.UserRole.admin)
+    user = make_user(db, "user@example.com")
+    user_id = db.query(models.Utilisateurs.id_users).filter_by(email="user@example.com").scalar()
+
+    plans: list[tuple[str, list[str]]] = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        head = statement.lstrip().upper()
+        if executemany or head.startswith("EXPLAIN") or not head.startswith(("SELECT", "UPDATE", "DELETE")):
+            return
+        if not any(f'"{t}"' in head or f" {t} " in head or f" {t}\n" in head for t in HOT_TABLES):
+            return
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        plans.append((statement, [row[-1] for row in rows]))
+
+    event.listen(engine, "before_cursor_execute", explain)
+    try:
+        for pid in pids[:3]:
+            assert client.post("/cart/add", json={"id_produit": pid, "quantite": 1}, headers=user).status_code == 200
+        assert client.post("/cart/add", json={"id_produit": pids[0], "quantite": 1}, headers=user).status_code == 200
+        assert client.get("/cart", headers=user).status_code == 200
+        assert client.get("/carts", headers=user).status_code == 200
+        assert client.post("/orders", headers=user).status_code == 200
+        assert client.post("/cart/new", headers=user).status_code == 200
+        assert client.post("/cart/clear", headers=user).status_code == 200
+        assert client.get("/orders?statut=pending", headers=admin).status_code == 200
+        assert client.get(f"/orders?user_id={user_id}", headers=admin).status_code == 200
+        assert client.get(
+            "/orders?date_from=2020-01-01T00:00:00&date_to=2100-01-01T00:00:00", headers=admin
+        ).status_code == 200
+        assert client.get(f"/admin/carts?user_id={user_id}", headers=admin).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", explain)
+
+    assert plans, "no cart/order statements were captured"
+    scans = [(statement, plan) for statement, plan in plans if _full_scans(plan)]
+    assert not scans, "\n\n".join(f"{statement}\n  -> {'; '.join(plan)}" for statement, plan in scans)
@@ -0,0 +1,61 @@
+import pytest
+
+from backend import ratelimit, security
+from conftest import QueryCounter, make_user
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """Rate limits on, bcrypt stubbed out; returns the list of password checks."""
+    monkeypatch.setattr(ratelimit, "AUTH_RATE_LIMIT", True)
+    checks = []
+
+    def check_password_pooled(plain, hashed):
+        checks.append(plain)
+        return False, False
+
+    monkeypatch.setattr(security, "check_password_pooled", check_password_pooled)
+    return checks
+
+
+def _login(client, email: str):
+    return client.post("/auth/login", json={"email": email, "password": "wrong"})
+
+
+def test_sixth_login_for_an_email_is_refused_before_any_work(client, db, limited):
+    make_user(db, "user@example.com")
+    for _ in range(ratelimit.LOGIN_EMAIL_BURST):
+        assert _login(client, "user@example.com").status_code == 401
+    assert len(limited) == ratelimit.LOGIN_EMAIL_BURST
+
+    with QueryCounter() as counter:
+        refused = _login(client, "user@example.com")
+    assert refused.status_code == 429
+    assert int(refused.headers["Retry-After"]) >= 1
+    assert counter.count == 0
+    assert len(limited) == ratelimit.LOGIN_EMAIL_BURST
+    # Other accounts are unaffected
+    assert _login(client, "other@example.com").status_code == 401
+
+
+def test_emails_share_a_bucket_regardless_of_case_and_spaces(client, db, limited):
+    variants = ["user@example.com", "User@Example.com", " user@example.com ", "USER@EXAMPLE.COM", "user@example.COM "]
+    for email in variants[:ratelimit.LOGIN_EMAIL_BURST]:
+        assert _login(client, email).status_code == 401
+    assert _login(client, "  uSer@example.com").status_code == 429
+
+
+def _takes(store) -> list[float]:
+    """Waits for a fixed sequence of attempts on two keys."""
+    waits = []
+    for now in (0, 0, 0, 1, 2, 15, 15, 16, 80, 80):
+        waits.append(store.take("login:email:a", 3, 3 / 60, now))
+        waits.append(store.take("login:email:b", 2, 1 / 60, now))
+    return waits
+
+
+def test_sqlite_store_counts_like_the_memory_store(tmp_path):
+    memory = _takes(ratelimit.MemoryStore(100))
+    shared = _takes(ratelimit.SqliteStore(str(tmp_path / "buckets.db")))
+    assert shared == pytest.approx(memory)
+    assert any(w > 0 for w in memory) and any(w == 0 for w in memory[10:])
@@ -0,0 +1,56 @@
+from sqlalchemy import text
+
+from backend import models, search
+from backend.database import engine
+from conftest import make_products
+
+_OLD_TRIGGER = f"""
+    CREATE TRIGGER produit_fts_au AFTER UPDATE ON Produit BEGIN
+        DELETE FROM {search.FTS_TABLE} WHERE rowid = old.id_produit;
+        INSERT INTO {search.FTS_TABLE}(rowid, nom, description, marque, categorie) {search._SQLITE_DOC};
+    END
+"""
+
+
+def _rows_changed_by(sql: str, **params) -> int:
+    """Rows changed by one statement, counting those changed by its triggers."""
+    with engine.begin() as conn:
+        before = conn.execute(text("SELECT total_changes()")).scalar()
+        conn.execute(text(sql), params)
+        return conn.execute(text("SELECT total_changes()")).scalar() - before
+
+
+def test_stock_updates_skip_the_search_index(db):
+    pid = make_products(db, 1, stock=10)[0]
+    assert _rows_changed_by("UPDATE Produit SET stock = stock - 1 WHERE id_produit = :id", id=pid) == 1
+    # Searchable columns still re-index the product
+    assert _rows_changed_by("UPDATE Produit SET nom = 'zanzibar lamp' WHERE id_produit = :id", id=pid) > 1
+    assert search.ranked_ids(db, "zanzibar", 10) == [pid]
+
+
+def test_startup_replaces_the_old_update_trigger(db):
+    pid = make_products(db, 1, stock=10)[0]
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER produit_fts_au"))
+        conn.execute(text(_OLD_TRIGGER))
+    assert _rows_changed_by("UPDATE Produit SET stock = stock - 1 WHERE id_produit = :id", id=pid) > 1
+
+    search.ensure_search_index(engine)
+    assert _rows_changed_by("UPDATE Produit SET stock = stock - 1 WHERE id_produit = :id", id=pid) == 1
+    assert db.query(models.Produit.stock).filter(models.Produit.id_produit == pid).scalar() == 8
+
+
+def test_words_may_match_in_different_columns(client, db):
+    brand, cat = models.Marque(nom="Apple"), models.Categorie(nom="Phones")
+    db.add_all([brand, cat])
+    db.flush()
+    phone = models.Produit(nom="iPhone 15", description="128 Go", prix=900, stock=1,
+                           id_marque=brand.id_marque, id_categorie=cat.id_categorie)
+    db.add(phone)
+    db.commit()
+
+    assert search.ranked_ids(db, "apple iphone", 10) == [phone.id_produit]
+    assert search.ranked_ids(db, "phones appl", 10) == [phone.id_produit]
+    assert search.ranked_ids(db, "apple android", 10) == []
+    listing = client.get("/products", params={"q": "apple iph"}).json()
+    assert [p["id_produit"] for p in listing] == [phone.id_produit]
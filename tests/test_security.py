@@ -0,0 +1,63 @@
+import hashlib
+import time
+
+from jose import jwt
+
+from backend import models, security
+from conftest import make_user
+
+
+def _token(db, **claims) -> str:
+    user = models.Utilisateurs(nom="u", email="u@example.com", mdp_hash="x")
+    db.add(user)
+    db.commit()
+    return jwt.encode({"sub": str(user.id_users), "role": "client", **claims}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+
+
+def _cached(token: str) -> bool:
+    return hashlib.sha256(token.encode()).digest() in security._verified
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_expired_token_is_rejected_even_when_cached(client, db):
+    exp = int(time.time()) + 1
+    token = _token(db, exp=exp)
+    assert client.get("/carts", headers=_auth(token)).status_code == 200
+    assert _cached(token)
+
+    # python-jose still accepts a token during the second of its exp
+    time.sleep(max(0.0, exp + 1 - time.time()) + 0.1)
+    assert client.get("/carts", headers=_auth(token)).status_code == 401
+    assert not _cached(token)
+
+
+def test_tampered_token_is_rejected_and_never_cached(client, db):
+    token = make_user(db, "user@example.com")["Authorization"].split()[1]
+    header, payload, signature = token.split(".")
+    forged_payload = jwt.encode(
+        {**jwt.get_unverified_claims(token), "role": "admin"}, "not-the-key", algorithm=security.ALGORITHM
+    ).split(".")[1]
+    bad_signature = signature[:-2] + ("AA" if signature[-2:] != "AA" else "BB")
+    for forged in (f"{header}.{forged_payload}.{signature}", f"{header}.{payload}.{bad_signature}"):
+        assert client.get("/carts", headers=_auth(forged)).status_code == 401
+        assert client.get("/admin/carts", headers=_auth(forged)).status_code == 401
+        assert not _cached(forged)
+
+
+def test_token_without_expiry_is_not_cached(client, db):
+    token = _token(db)
+    assert client.get("/carts", headers=_auth(token)).status_code == 200
+    assert not _cached(token)
+
+
+def test_cache_never_grows_past_its_size(monkeypatch):
+    monkeypatch.setattr(security, "TOKEN_CACHE_SIZE", 3)
+    tokens = [security.create_access_token(str(i), "client") for i in range(10)]
+    for token in tokens:
+        security.decode_token(token)
+        assert len(security._verified) <= 3
+    # Least recently used go first
+    assert [_cached(t) for t in tokens] == [False] * 7 + [True] * 3